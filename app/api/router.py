@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from app.api.routes import agents, demo, users, memory
+from app.api.routes import agents, debug, demo, users, memory, metrics
 
 
 api_router = APIRouter()
@@ -8,3 +8,5 @@ api_router.include_router(demo.router)
 api_router.include_router(users.router)
 api_router.include_router(agents.router)
 api_router.include_router(memory.router)
+api_router.include_router(metrics.router)
+api_router.include_router(debug.router)
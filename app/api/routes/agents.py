@@ -1,13 +1,29 @@
 import asyncio
 from asyncio import CancelledError
-from fastapi import APIRouter, Request
+from typing import Annotated
+from urllib.parse import urlencode
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
 from fastapi.responses import StreamingResponse
+from redis.asyncio import Redis
 
+from app.core.streaming import coalesce_sse
+from app.core.config import get_settings
+from app.core.resumable import ResumableStream
+from app.db.deps import get_redis, get_tenant
 from app.services import agent_service
 from loguru import logger
 
 router = APIRouter(prefix="/agents", tags=["agents"])
 
+TenantDept = Annotated[str, Depends(get_tenant)]
+RedisDept = Annotated[Redis, Depends(get_redis)]
+StreamIdQuery = Annotated[str | None, Query(description="续传的流 id；Last-Event-ID 已带 id 时可省略")]
+LastEventIdHeader = Annotated[str | None, Header()]
+
+# 只影响输出方式、不影响内容的参数，不参与请求 key
+_PRESENTATION_PARAMS = {"replay", "stream_id"}
+
 
 async def _stream_with_disconnect(request: Request, generator):
     """安全的 streaming 包装器：
@@ -46,21 +62,142 @@ async def _stream_with_disconnect(request: Request, generator):
             logger.warning(f"{client} aborted")
 
 
-@router.get("/llm")
-async def llm(request: Request):
-    generator = agent_service.llm_stream(request.app.state.llm_sem)
+def _request_key(request: Request) -> str:
+    """同一路径 + 同一组查询参数视为相同请求，可以共享上游。"""
+    params = [
+        (name, value)
+        for name, value in request.query_params.multi_items()
+        if name not in _PRESENTATION_PARAMS
+    ]
+    query = urlencode(sorted(params))
+    return f"{request.url.path}?{query}"
+
+
+async def _primed(generator):
+    """先在路由里取出第一个 chunk 再开始响应。
+
+    限流器拒绝（LimiterRejected）会在响应头发出之前抛出，交给异常处理器返回 503；
+    否则一旦 StreamingResponse 开始发送就只能中断连接了。
+    """
+    try:
+        first = await anext(generator)
+    except StopAsyncIteration:
+        first = None
+    except BaseException:
+        await generator.aclose()
+        raise
+
+    async def stream():
+        try:
+            if first is not None:
+                yield first
+            async for chunk in generator:
+                yield chunk
+        finally:
+            await generator.aclose()
+
+    return stream()
+
+
+def _resume_point(stream_id: str | None, last_event_id: str | None) -> tuple[str, int] | None:
+    """解析续传位置：Last-Event-ID 为 "<stream_id>:<offset>"，或 ?stream_id= 加纯数字 offset。"""
+    if last_event_id:
+        sid, sep, offset = last_event_id.rpartition(":")
+        if not sep:
+            sid, offset = stream_id or "", last_event_id
+        if sid and offset.isdigit():
+            return sid, int(offset)
+    if stream_id:
+        return stream_id, 0
+    return None
+
+
+def _sse_response(request: Request, stream: ResumableStream, offset: int) -> StreamingResponse:
+    frames = request.app.state.agent_streams.attach(stream, offset)
     return StreamingResponse(
-        _stream_with_disconnect(request, generator),
+        _stream_with_disconnect(request, frames),
         media_type="text/event-stream",
-        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            "X-Stream-Id": stream.id,
+        },
     )
 
 
-@router.get("/http")
-async def http(request: Request):
-    generator = agent_service.echo_http(request.app.state.http_sem)
-    return StreamingResponse(
-        _stream_with_disconnect(request, generator),
-        media_type="text/event-stream",
-        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+def _resume(request: Request, point: tuple[str, int], tenant: str) -> StreamingResponse:
+    stream_id, offset = point
+    stream = request.app.state.agent_streams.get_owned(stream_id, tenant)
+    if stream is None:
+        raise HTTPException(status_code=404, detail="流不存在或已过期，请重新发起请求")
+    if not stream.can_resume(offset):
+        raise HTTPException(
+            status_code=409,
+            detail=f"续传位置已不在缓冲中，可续传范围 {stream.first_offset - 1}~{stream.last_offset}",
+        )
+    return _sse_response(request, stream, offset)
+
+
+def _start(request: Request, generator, tenant: str) -> StreamingResponse:
+    # 上游在独立任务里运行并合并成帧，客户端断开后仍继续写缓冲，宽限期内可续传
+    stream = request.app.state.agent_streams.start(
+        coalesce_sse(generator, framer=str), owner=tenant
     )
+    return _sse_response(request, stream, 0)
+
+
+@router.get("/llm")
+async def llm(
+    request: Request,
+    tenant: TenantDept,
+    redis: RedisDept,
+    replay: Annotated[agent_service.ReplayMode, Query()] = "paced",
+    stream_id: StreamIdQuery = None,
+    last_event_id: LastEventIdHeader = None,
+):
+    point = _resume_point(stream_id, last_event_id)
+    if point is not None:
+        return _resume(request, point, tenant)
+
+    settings = get_settings()
+    key = _request_key(request)
+
+    # 最近完整生成过的相同请求直接回放，不占 llm_sem
+    entries = await agent_service.load_cached_stream(redis, key)
+    if entries is not None:
+        generator = agent_service.replay_stream(entries, replay)
+        cache_status = "HIT"
+    else:
+        # 相同请求挂到同一个正在运行的上游上，只占一个 llm_sem 名额；
+        # 上游按第一个请求者的租户排队，完整结束后写入缓存
+        generator = await _primed(
+            request.app.state.llm_broadcast.subscribe(
+                key,
+                lambda: agent_service.record_stream(
+                    redis,
+                    key,
+                    agent_service.llm_stream(request.app.state.llm_sem, tenant),
+                    ttl=settings.llm_stream_cache_ttl,
+                    max_bytes=settings.llm_stream_cache_max_bytes,
+                ),
+            )
+        )
+        cache_status = "MISS"
+    response = _start(request, generator, tenant)
+    response.headers["X-Cache"] = cache_status
+    return response
+
+
+@router.get("/http")
+async def http(
+    request: Request,
+    tenant: TenantDept,
+    stream_id: StreamIdQuery = None,
+    last_event_id: LastEventIdHeader = None,
+):
+    point = _resume_point(stream_id, last_event_id)
+    if point is not None:
+        return _resume(request, point, tenant)
+
+    generator = await _primed(agent_service.echo_http(request.app.state.http_sem, tenant))
+    return _start(request, generator, tenant)
@@ -0,0 +1,32 @@
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+
+from app.core.sql_profiler import SqlProfiler
+from app.db.deps import get_current_user_from_token
+
+
+router = APIRouter(
+    prefix="/debug", tags=["debug"], dependencies=[Depends(get_current_user_from_token)]
+)
+
+
+def _profiler(request: Request) -> SqlProfiler:
+    profiler = getattr(request.app.state, "sql_profiler", None)
+    if profiler is None:
+        raise HTTPException(status_code=404, detail="SQL profiler 未开启（MYSQL_PROFILE=true）")
+    return profiler
+
+
+@router.get("/sql/top")
+async def sql_top(
+    request: Request,
+    n: int = Query(20, ge=1, le=500),
+    order_by: Literal["total", "count", "p99", "rows"] = "total",
+):
+    return _profiler(request).top(n, order_by)
+
+
+@router.delete("/sql/top", status_code=204)
+async def sql_reset(request: Request):
+    _profiler(request).reset()
@@ -8,6 +8,7 @@ from fastapi.responses import StreamingResponse
 from redis.asyncio import Redis
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.streaming import coalesce_sse, sse_json
 from app.schemas import ChatResponse
 from app.db.redis import ping_redis
 from app.db.mysql import mysql_ping
@@ -88,8 +89,8 @@ async def mock_llm_generator():
 
 @router.get("/stream")
 async def chat_stream():
-    # 使用 StreamingResponse 返回生成器
-    return StreamingResponse(mock_llm_generator(), media_type="text/event-stream")
+    # 使用 StreamingResponse 返回生成器；逐字输出合并成 SSE 帧再发送
+    return StreamingResponse(coalesce_sse(mock_llm_generator()), media_type="text/event-stream")
 
 
 async def long_text_generator():
@@ -109,13 +110,17 @@ async def long_text_generator():
     )
 
     for i in range(0, len(text), 2):
-        chunk = text[i : i + 2]
-        data = {"time": time.time(), "content": chunk, "is_end": False}
-        # SSE协议格式：必须以 "data: "开头，以"\n\n" 结尾
-        yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+        yield text[i : i + 2]
         # 模拟模型推理的微小延迟
         await asyncio.sleep(0.05)
 
+
+async def long_text_sse():
+    # SSE协议格式：必须以 "data: "开头，以"\n\n" 结尾；合并后每帧只 json.dumps 一次
+    framer = sse_json(lambda content: {"time": time.time(), "content": content, "is_end": False})
+    async for frame in coalesce_sse(long_text_generator(), framer=framer):
+        yield frame
+
     d = {"is_end": True}
     yield f"data: {json.dumps(d)}\n\n"
 
@@ -123,7 +128,7 @@ async def long_text_generator():
 @router.get("/stream-llm")
 async def stream_text():
     return StreamingResponse(
-        long_text_generator(),
+        long_text_sse(),
         media_type="text/event-stream",
         headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
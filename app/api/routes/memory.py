@@ -1,17 +1,20 @@
 import asyncio
 import contextvars
-import json
 import time
 import uuid
-from collections import defaultdict
-from typing import Any, AsyncGenerator, Callable
+from typing import Annotated, Any, AsyncGenerator, Callable
 
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Header, HTTPException, Query, Request
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
+from app.core.progress import ProgressBus, sse_pack
+
 router = APIRouter(prefix="/memory", tags=["memory"])
 
+# 一条多路订阅连接最多同时观察的 trace 数
+MAX_MULTIPLEX_TRACES = 100
+
 
 class EphemeralContext(BaseModel):
     trace_id: str
@@ -20,87 +23,13 @@ class EphemeralContext(BaseModel):
     token_usage: dict[str, int] = Field(default_factory=lambda: {"input": 0, "output": 0})
 
 
-class ProgressEvent(BaseModel):
-    trace_id: str
-    seq: int
-    stage: str
-    progress: int
-    message: str
-    ts: float
-    done: bool = False
-    error: str | None = None
-    meta: dict[str, Any] = Field(default_factory=dict)
-
-
 agent_ctx_var: contextvars.ContextVar[EphemeralContext] = contextvars.ContextVar("agent_ctx")
+# 当前请求所用的进度总线（app.state.progress_bus），供深层的 emit_progress 使用
+progress_bus_var: contextvars.ContextVar[ProgressBus] = contextvars.ContextVar("progress_bus")
 
 
-def sse_pack(event: str, data: dict[str, Any], event_id: int | None = None) -> str:
-    lines: list[str] = []
-    if event_id is not None:
-        lines.append(f"id: {event_id}")
-    lines.append(f"event: {event}")
-    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
-    return "\n".join(lines) + "\n\n"
-
-
-class ProgressBus:
-    def __init__(self) -> None:
-        self._subs: dict[str, set[asyncio.Queue[dict[str, Any]]]] = defaultdict(set)
-        self._seq: dict[str, int] = defaultdict(int)
-        self._lock = asyncio.Lock()
-
-    async def publish(self, trace_id: str, payload: dict[str, Any]) -> None:
-        async with self._lock:
-            self._seq[trace_id] += 1
-            seq = self._seq[trace_id]
-            subscribers = list(self._subs.get(trace_id, set()))
-
-        event = ProgressEvent(trace_id=trace_id, seq=seq, **payload).model_dump()
-
-        for queue in subscribers:
-            try:
-                queue.put_nowait(event)
-            except asyncio.QueueFull:
-                _ = queue.get_nowait()
-                queue.put_nowait(event)
-
-    async def cleanup_trace(self, trace_id: str) -> None:
-        """Release sequence state when the trace has no active subscribers."""
-        async with self._lock:
-            subscribers = self._subs.get(trace_id)
-            if subscribers:
-                return
-            self._subs.pop(trace_id, None)
-            self._seq.pop(trace_id, None)
-
-    async def subscribe(self, trace_id: str) -> AsyncGenerator[dict[str, Any], None]:
-        queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue(maxsize=200)
-        async with self._lock:
-            self._subs[trace_id].add(queue)
-
-        try:
-            while True:
-                try:
-                    event = await asyncio.wait_for(queue.get(), timeout=15)
-                except asyncio.TimeoutError:
-                    yield {"event": "ping", "trace_id": trace_id, "ts": time.time()}
-                    continue
-
-                yield event
-                if event.get("done") or event.get("error"):
-                    break
-        finally:
-            async with self._lock:
-                subscribers = self._subs.get(trace_id)
-                if subscribers is not None:
-                    subscribers.discard(queue)
-                    if not subscribers:
-                        self._subs.pop(trace_id, None)
-                        self._seq.pop(trace_id, None)
-
-
-progress_bus = ProgressBus()
+def _progress_bus(request: Request) -> ProgressBus:
+    return request.app.state.progress_bus
 
 
 async def emit_progress(
@@ -113,7 +42,7 @@ async def emit_progress(
     meta: dict[str, Any] | None = None,
 ) -> None:
     ctx = agent_ctx_var.get()
-    await progress_bus.publish(
+    await progress_bus_var.get().publish(
         ctx.trace_id,
         {
             "stage": stage,
@@ -159,7 +88,9 @@ async def context_wrapper(
 ) -> AsyncGenerator[str, None]:
     trace_id = request.headers.get("X-Trace-Id", f"tr-{uuid.uuid4().hex[:8]}")
     ctx = EphemeralContext(trace_id=trace_id)
+    bus = _progress_bus(request)
     token = agent_ctx_var.set(ctx)
+    bus_token = progress_bus_var.set(bus)
 
     try:
         await emit_progress("accepted", 0, "request accepted")
@@ -180,7 +111,8 @@ async def context_wrapper(
         raise
     finally:
         print(f"统计：Trace={ctx.trace_id}, 总计步骤={len(ctx.steps)}, Token={ctx.token_usage}")
-        await progress_bus.cleanup_trace(trace_id)
+        await bus.cleanup_trace(trace_id)
+        progress_bus_var.reset(bus_token)
         agent_ctx_var.reset(token)
 
 
@@ -193,16 +125,68 @@ async def chat(request: Request) -> StreamingResponse:
     )
 
 
+def _parse_since(value: str | None, last_event_id: str | None) -> dict[str, int]:
+    """解析 "a:3,b:7" 形式的续传位置；Last-Event-ID（"trace:seq"）合并进来。"""
+    since: dict[str, int] = {}
+    items = value.split(",") if value else []
+    if last_event_id:
+        items.append(last_event_id)
+    for item in items:
+        trace_id, sep, seq = item.strip().rpartition(":")
+        if sep and trace_id and seq.isdigit():
+            since[trace_id] = max(since.get(trace_id, 0), int(seq))
+    return since
+
+
+@router.get("/progress")
+async def progress_many(
+    request: Request,
+    trace_ids: Annotated[str, Query(description="逗号分隔的 trace_id 列表")],
+    since: Annotated[str | None, Query(description="续传位置，如 a:3,b:7")] = None,
+    last_event_id: Annotated[str | None, Header()] = None,
+) -> StreamingResponse:
+    """一条 SSE 连接同时订阅多个 trace；事件 id 为 "<trace_id>:<seq>"，全部结束后关闭。
+
+    EventSource 自动重连只会带回最后一个事件的 id，其它 trace 会从缓冲起点补发，
+    客户端按 id 去重；需要精确续传时用 since 传入每个 trace 的位置。
+    """
+    ids = list(dict.fromkeys(t.strip() for t in trace_ids.split(",") if t.strip()))
+    if not ids:
+        raise HTTPException(status_code=422, detail="trace_ids 不能为空")
+    if len(ids) > MAX_MULTIPLEX_TRACES:
+        raise HTTPException(
+            status_code=422, detail=f"一次最多订阅 {MAX_MULTIPLEX_TRACES} 个 trace"
+        )
+    bus = _progress_bus(request)
+    resume_from = _parse_since(since, last_event_id)
+
+    async def stream_progress() -> AsyncGenerator[bytes, None]:
+        async for frame in bus.subscribe_many(ids, resume_from):
+            yield frame.mux_data
+
+    return StreamingResponse(
+        stream_progress(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/progress/{trace_id}")
-async def progress(trace_id: str) -> StreamingResponse:
-    async def stream_progress() -> AsyncGenerator[str, None]:
-        async for event in progress_bus.subscribe(trace_id):
-            if event.get("event") == "ping":
-                yield sse_pack("ping", event)
-                continue
-
-            name = "error" if event.get("error") else ("done" if event.get("done") else "progress")
-            yield sse_pack(name, event, event_id=event["seq"])
+async def progress(
+    request: Request,
+    trace_id: str,
+    last_event_id: Annotated[str | None, Header()] = None,
+) -> StreamingResponse:
+    """订阅进度；EventSource 断线重连时会带上 Last-Event-ID，从该 seq 之后补发。"""
+    bus = _progress_bus(request)
+    try:
+        resume_from = max(0, int(last_event_id)) if last_event_id else 0
+    except ValueError:
+        resume_from = 0
+
+    async def stream_progress() -> AsyncGenerator[bytes, None]:
+        async for frame in bus.subscribe(trace_id, resume_from):
+            yield frame.data
 
     return StreamingResponse(
         stream_progress(),
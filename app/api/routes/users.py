@@ -1,14 +1,30 @@
-import json
-from typing import Annotated, Any
+from typing import Annotated, Any, Literal
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from redis.asyncio import Redis
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.schemas import UserCreate, UserOut, UserPage, UserUpdate
+from app.core.config import get_settings
+from app.core.pagination import InvalidCursor
+from app.core.responses import ModelResponse
+from app.models.user import EXT_INDEXED_KEYS
+from app.schemas import (
+    USER_FIELDS,
+    TotalMode,
+    UserBatchResult,
+    UserCreate,
+    UserImportResult,
+    UserLookup,
+    UserOut,
+    UserPage,
+    UserPartialPage,
+    UserUpdate,
+    UsernameMatch,
+)
 from app.db.deps import get_current_user_from_token, get_mysql_session, get_redis
-from app.services import user_service
+from app.services import auth_service, user_service
 
 
 router = APIRouter(prefix="/users", tags=["users"])
@@ -24,36 +40,201 @@ class LogoutPayload(BaseModel):
 
 
 SessionDept =  Annotated[AsyncSession, Depends(get_mysql_session)]
+RedisDept = Annotated[Redis, Depends(get_redis)]
+TotalModeQuery = Annotated[
+    TotalMode, Query(description="exact=实时 COUNT，cached=Redis 缓存，estimate=表统计估算")
+]
+MatchQuery = Annotated[
+    UsernameMatch,
+    Query(description="username 匹配方式：prefix=前缀（走索引），contains=子串，fulltext=ngram 全文索引"),
+]
+FieldsQuery = Annotated[
+    str | None,
+    Query(description=f"逗号分隔的返回字段，可选：{','.join(USER_FIELDS)}"),
+]
+
+
+def _parse_fields(fields: str | None) -> tuple[str, ...] | None:
+    if fields is None:
+        return None
+    selected = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    invalid = [f for f in selected if f not in USER_FIELDS]
+    if invalid or not selected:
+        bad = ",".join(invalid) if invalid else repr(fields)
+        raise HTTPException(
+            status_code=422,
+            detail=f"无效的 fields: {bad}，可选：{','.join(USER_FIELDS)}",
+        )
+    return selected
+
+
+def _parse_ext_filters(request: Request) -> dict[str, str] | None:
+    """收集 ext.<key>=value 查询参数，只接受声明过索引的 key。"""
+    ext: dict[str, str] = {}
+    for name, value in request.query_params.multi_items():
+        if not name.startswith("ext."):
+            continue
+        key = name[len("ext."):]
+        if key not in EXT_INDEXED_KEYS:
+            raise HTTPException(
+                status_code=422,
+                detail=f"ext.{key} 不支持过滤，可选：{','.join(EXT_INDEXED_KEYS)}",
+            )
+        if len(value) > EXT_INDEXED_KEYS[key]:
+            raise HTTPException(status_code=422, detail=f"ext.{key} 过长")
+        ext[key] = value
+    return ext or None
 
 
 @router.post("", response_model=UserOut)
 async def create_user(
     payload: UserCreate,
     session: SessionDept,
+    redis: RedisDept,
+):
+    return await user_service.create_user(session, payload, redis)
+
+
+@router.post("/batch", response_model=UserBatchResult)
+async def create_users_batch(
+    # 逐条在 service 中校验，单条不合法只影响该条，不让整批 422
+    payloads: Annotated[
+        list[dict[str, Any]], Body(max_length=get_settings().user_batch_max)
+    ],
+    session: SessionDept,
+    redis: RedisDept,
+):
+    return await user_service.create_users_batch(session, payloads, redis)
+
+
+@router.post("/import", response_model=UserImportResult)
+async def import_users(
+    request: Request,
+    session: SessionDept,
+    redis: RedisDept,
+    chunk_size: Annotated[int | None, Query(ge=1, le=5000)] = None,
+    continue_on_error: Annotated[bool, Query()] = True,
+):
+    """请求体为 NDJSON，每行一个 UserCreate。"""
+    return await user_service.import_users(
+        session,
+        request.stream(),
+        chunk_size or get_settings().user_import_chunk_size,
+        continue_on_error,
+        redis,
+    )
+
+
+@router.post("/lookup", response_model=list[UserOut])
+async def lookup_users(
+    payload: UserLookup,
+    session: SessionDept,
 ):
-    return await user_service.create_user(session, payload)
+    return await user_service.get_users(session, payload.ids)
 
 
-@router.get("", response_model=UserPage)
+@router.get(
+    "", response_model=UserPage | UserPartialPage, response_class=ModelResponse
+)
 async def list_users(
     session: SessionDept,
+    redis: RedisDept,
     page: Annotated[int, Query(ge=1)] = 1,
     size: Annotated[int, Query(ge=1, le=1000)] = 10,
+    cursor: Annotated[str | None, Query(description="上一页返回的 next_cursor")] = None,
+    total_mode: TotalModeQuery = "exact",
+    fields: FieldsQuery = None,
 ):
-    return await user_service.list_users(session, page, size)
+    selected = _parse_fields(fields)
+    try:
+        page_data = await user_service.list_users(
+            session,
+            page,
+            size,
+            cursor,
+            redis=redis,
+            total_mode=total_mode,
+            fields=selected,
+        )
+    except InvalidCursor as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return ModelResponse(page_data)
 
 
-@router.get("/raw", response_model=UserPage)
+@router.get(
+    "/raw", response_model=UserPage | UserPartialPage, response_class=ModelResponse
+)
 async def list_users_raw(
+    request: Request,
     session: SessionDept,
+    redis: RedisDept,
     page: Annotated[int, Query(ge=1)] = 1,
     size: Annotated[int, Query(ge=1, le=100)] = 10,
     username: Annotated[str | None, Query()] = None,
     age_min: Annotated[int | None, Query(ge=0)] = None,
     age_max: Annotated[int | None, Query(ge=0)] = None,
+    match: MatchQuery = "contains",
+    cursor: Annotated[str | None, Query(description="上一页返回的 next_cursor")] = None,
+    total_mode: TotalModeQuery = "exact",
+    fields: FieldsQuery = None,
+):
+    """额外支持 ext.<key>=value 过滤 ext_json 中声明过索引的 key，例如 ext.city=Shanghai。"""
+    selected = _parse_fields(fields)
+    ext = _parse_ext_filters(request)
+    try:
+        page_data = await user_service.list_users_raw(
+            session,
+            page,
+            size,
+            username,
+            age_min,
+            age_max,
+            cursor,
+            redis=redis,
+            total_mode=total_mode,
+            fields=selected,
+            ext=ext,
+            match=match,
+        )
+    except InvalidCursor as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return ModelResponse(page_data)
+
+
+@router.get("/export")
+async def export_users(
+    request: Request,
+    format: Annotated[Literal["ndjson", "csv"], Query()] = "ndjson",
+    username: Annotated[str | None, Query()] = None,
+    age_min: Annotated[int | None, Query(ge=0)] = None,
+    age_max: Annotated[int | None, Query(ge=0)] = None,
+    match: MatchQuery = "contains",
 ):
-    return await user_service.list_users_raw(
-        session, page, size, username, age_min, age_max
+    chunks = user_service.export_users(
+        request.app.state.mysql_session_factory,
+        format,
+        username,
+        age_min,
+        age_max,
+        _parse_ext_filters(request),
+        match,
+    )
+
+    async def body():
+        try:
+            async for chunk in chunks:
+                # 客户端断开后立即停止读库，finally 中关闭服务端游标和连接
+                if await request.is_disconnected():
+                    break
+                yield chunk
+        finally:
+            await chunks.aclose()
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        body(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="users.{format}"'},
     )
 
 
@@ -61,8 +242,9 @@ async def list_users_raw(
 async def get_user(
     user_id: int,
     session: SessionDept,
+    redis: RedisDept,
 ):
-    user = await user_service.get_user(session, user_id)
+    user = await user_service.get_user(session, user_id, redis)
     if user is None:
         raise HTTPException(status_code=404, detail="用户不存在")
     return user
@@ -73,8 +255,9 @@ async def update_user(
     user_id: int,
     payload: UserUpdate,
     session: SessionDept,
+    redis: RedisDept,
 ):
-    user = await user_service.update_user(session, user_id, payload)
+    user = await user_service.update_user(session, user_id, payload, redis)
     if user is None:
         raise HTTPException(status_code=404, detail="用户不存在")
     return user
@@ -85,9 +268,10 @@ async def delete_user(
     user_id: int,
     _current_user: Annotated[dict, Depends(get_current_user_from_token)],
     session: SessionDept,
+    redis: RedisDept,
 ):  
     
-    ok = await user_service.delete_user(session, user_id)
+    ok = await user_service.delete_user(session, user_id, redis)
     if not ok:
         raise HTTPException(status_code=404, detail="用户不存在")
     return {"deleted": True, "id": user_id}
@@ -98,8 +282,7 @@ async def login(
     payload: LoginPayload,
     redis: Annotated[Redis, Depends(get_redis)],
 ):
-    user_json = json.dumps(payload.user, ensure_ascii=False)
-    await redis.set(f"login:token:{payload.token}", user_json)
+    await auth_service.store_session(redis, payload.token, payload.user)
     return {"token": payload.token, "stored": True}
 
 
@@ -108,5 +291,13 @@ async def logout(
     payload: LogoutPayload,
     redis: Annotated[Redis, Depends(get_redis)],
 ):
-    await redis.delete(f"login:token:{payload.token}")
+    await auth_service.revoke_session(redis, payload.token)
     return {"token": payload.token, "deleted": True}
+
+
+@router.get("/token-cache/stats")
+async def token_cache_stats(
+    request: Request,
+    _current_user: Annotated[dict, Depends(get_current_user_from_token)],
+):
+    return request.app.state.token_cache.stats()
@@ -0,0 +1,133 @@
+import asyncio
+from contextlib import suppress
+from typing import AsyncIterator, Callable
+
+from loguru import logger
+
+
+class SubscriberLagged(Exception):
+    """订阅者消费太慢，缓冲超过上限被踢出。"""
+
+
+_END = object()
+
+
+class _Failed:
+    __slots__ = ("error",)
+
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+
+class _Channel:
+    """一个正在运行的上游生成器，以及挂在它上面的所有订阅者。"""
+
+    __slots__ = ("key", "history", "history_bytes", "joinable", "subs", "task")
+
+    def __init__(self, key: str) -> None:
+        self.key = key
+        self.history: list[str] = []
+        self.history_bytes = 0
+        # 历史超过上限后不再接收新订阅者，新请求会另起一个上游
+        self.joinable = True
+        self.subs: set[asyncio.Queue] = set()
+        self.task: asyncio.Task[None] | None = None
+
+
+class Broadcaster:
+    """相同 key 的并发请求共享一个上游生成器（singleflight streaming）。
+
+    - 第一个订阅者启动上游，之后的订阅者直接挂上去，只占一份限流名额和上游算力
+    - 晚到的订阅者先收到已经产生的全部 chunk，再接着收实时 chunk
+    - 每个订阅者有独立的缓冲，积压超过 queue_size 的慢订阅者会收到 SubscriberLagged
+    - 上游只在最后一个订阅者离开时取消；上游结束后 key 释放，后续请求重新开始
+    """
+
+    def __init__(self, *, queue_size: int = 1024, max_history_bytes: int = 1024 * 1024) -> None:
+        self.queue_size = queue_size
+        self.max_history_bytes = max_history_bytes
+        self._channels: dict[str, _Channel] = {}
+
+    def subscribers(self, key: str) -> int:
+        channel = self._channels.get(key)
+        return len(channel.subs) if channel is not None else 0
+
+    async def subscribe(
+        self, key: str, factory: Callable[[], AsyncIterator[str]]
+    ) -> AsyncIterator[str]:
+        channel = self._channels.get(key)
+        if channel is None or not channel.joinable:
+            channel = _Channel(key)
+            self._channels[key] = channel
+            channel.task = asyncio.create_task(self._pump(channel, factory()))
+
+        # 登记队列和复制历史之间没有 await，不会漏掉或重复 chunk
+        queue: asyncio.Queue = asyncio.Queue()
+        channel.subs.add(queue)
+        history = list(channel.history)
+
+        try:
+            for chunk in history:
+                yield chunk
+            while True:
+                item = await queue.get()
+                if item is _END:
+                    return
+                if isinstance(item, _Failed):
+                    raise item.error
+                yield item
+        finally:
+            channel.subs.discard(queue)
+            if not channel.subs and channel.task is not None and not channel.task.done():
+                # 最后一个订阅者离开，上游没人要了
+                channel.task.cancel()
+                self._release(channel)
+
+    def _release(self, channel: _Channel) -> None:
+        if self._channels.get(channel.key) is channel:
+            del self._channels[channel.key]
+
+    def _send(self, channel: _Channel, item: object) -> None:
+        for queue in list(channel.subs):
+            if item is not _END and not isinstance(item, _Failed) and queue.qsize() >= self.queue_size:
+                # 慢订阅者：清空积压，只留一个错误让它退出，不拖慢其他人
+                channel.subs.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(_Failed(SubscriberLagged(channel.key)))
+                continue
+            queue.put_nowait(item)
+
+    async def _pump(self, channel: _Channel, upstream: AsyncIterator[str]) -> None:
+        try:
+            async for chunk in upstream:
+                if channel.joinable:
+                    channel.history.append(chunk)
+                    channel.history_bytes += len(chunk.encode())
+                    if channel.history_bytes > self.max_history_bytes:
+                        channel.joinable = False
+                        channel.history.clear()
+                        self._release(channel)
+                self._send(channel, chunk)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.warning(f"broadcast upstream {channel.key} failed: {exc!r}")
+            self._send(channel, _Failed(exc))
+        else:
+            self._send(channel, _END)
+        finally:
+            self._release(channel)
+            aclose = getattr(upstream, "aclose", None)
+            if aclose is not None:
+                with suppress(Exception):
+                    await aclose()
+
+    async def close(self) -> None:
+        tasks = [channel.task for channel in self._channels.values() if channel.task is not None]
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            with suppress(asyncio.CancelledError):
+                await task
+        self._channels.clear()
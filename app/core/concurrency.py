@@ -1,17 +1,216 @@
+import asyncio
 from asyncio import Semaphore
 from contextlib import asynccontextmanager
+import heapq
+import math
 import time
-from loguru import logger
+
+from app.core import metrics
+
+
+class LimiterRejected(Exception):
+    """排队已满或等待超时，应直接返回 503 + Retry-After。"""
+
+    def __init__(self, name: str, reason: str, retry_after: int) -> None:
+        super().__init__(f"{name}: {reason}")
+        self.name = name
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+DEFAULT_TENANT = "default"
+
+
+class AdaptiveLimiter:
+    """AIMD 自适应并发限制器，用来替换固定大小的 Semaphore。
+
+    - 持有时间低于 latency_target 时并发上限缓慢加一（每个完整窗口 +increase）
+    - 超过目标或执行出错时按 decrease 乘性收缩
+    - 等待队列有上限，排队超过 max_wait 秒同样拒绝，避免请求堆积到客户端超时
+    - 排队按租户做加权公平调度（start-time fair queuing）：每个请求的虚拟完成时间为
+      max(当前虚拟时间, 该租户上一个请求的完成时间) + 1/weight，按此顺序放行，
+      重度租户只会排在自己的请求后面；tenant_max_inflight 限制单租户同时占用的名额
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        initial: int,
+        max_limit: int,
+        latency_target: float,
+        min_limit: int = 1,
+        max_queue: int = 64,
+        max_wait: float = 5.0,
+        increase: float = 1.0,
+        decrease: float = 0.7,
+        weights: dict[str, float] | None = None,
+        tenant_max_inflight: int | None = None,
+    ) -> None:
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.increase = increase
+        self.decrease = decrease
+        self.weights = weights or {}
+        self.tenant_max_inflight = tenant_max_inflight
+        self._limit = float(initial)
+        self._inflight = 0
+        # 堆元素：(虚拟完成时间, 入队序号, waiter, 租户)
+        self._waiters: list[tuple[float, int, asyncio.Future[None], str]] = []
+        self._queued = 0
+        self._seq = 0
+        self._vtime = 0.0
+        self._tenant_finish: dict[str, float] = {}
+        self._tenant_inflight: dict[str, int] = {}
+        self._tenant_queued: dict[str, int] = {}
+        # 持有时间的指数滑动平均，用于估算 Retry-After
+        self._avg_hold = latency_target
+        metrics.limiters[name] = self
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_limit, int(self._limit))
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queued
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(self._avg_hold))
+
+    def _reject(self, reason: str) -> LimiterRejected:
+        return LimiterRejected(self.name, reason, self._retry_after())
+
+    def _tenant_capped(self, tenant: str) -> bool:
+        cap = self.tenant_max_inflight
+        return cap is not None and self._tenant_inflight.get(tenant, 0) >= cap
+
+    def _grant(self, tenant: str) -> None:
+        self._inflight += 1
+        self._tenant_inflight[tenant] = self._tenant_inflight.get(tenant, 0) + 1
+
+    async def acquire(self, tenant: str = DEFAULT_TENANT) -> None:
+        if (
+            self._inflight < self.limit
+            and not self._queued
+            and not self._tenant_capped(tenant)
+        ):
+            self._grant(tenant)
+            return
+        if self._queued >= self.max_queue:
+            raise self._reject("queue full")
+
+        weight = self.weights.get(tenant, 1.0)
+        finish = max(self._vtime, self._tenant_finish.get(tenant, 0.0)) + 1.0 / weight
+        self._tenant_finish[tenant] = finish
+        waiter = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        heapq.heappush(self._waiters, (finish, self._seq, waiter, tenant))
+        self._queued += 1
+        self._tenant_queued[tenant] = self._tenant_queued.get(tenant, 0) + 1
+        # 队列里可能只有被单租户上限挡住的请求，此时新请求可以直接放行
+        self._wake()
+
+        try:
+            await asyncio.wait_for(waiter, timeout=self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            if waiter.done() and not waiter.cancelled():
+                # 超时/取消与放行同时发生：名额已经记到我们头上，需要归还
+                self._release_slot(tenant)
+            else:
+                # 堆中的条目惰性删除，_wake 时跳过已结束的 waiter
+                self._queued -= 1
+                self._dequeue_tenant(tenant)
+                self._forget_idle_tenant(tenant)
+            if isinstance(exc, asyncio.CancelledError):
+                raise
+            raise self._reject("queue wait timeout") from None
+
+    def release(self, held: float, ok: bool, tenant: str = DEFAULT_TENANT) -> None:
+        self._avg_hold = self._avg_hold * 0.8 + held * 0.2
+        if ok and held <= self.latency_target:
+            self._limit = min(self.max_limit, self._limit + self.increase / self._limit)
+        else:
+            self._limit = max(self.min_limit, self._limit * self.decrease)
+        self._release_slot(tenant)
+
+    def _release_slot(self, tenant: str) -> None:
+        self._inflight -= 1
+        remaining = self._tenant_inflight.get(tenant, 1) - 1
+        if remaining > 0:
+            self._tenant_inflight[tenant] = remaining
+        else:
+            self._tenant_inflight.pop(tenant, None)
+            self._forget_idle_tenant(tenant)
+        self._wake()
+
+    def _dequeue_tenant(self, tenant: str) -> None:
+        remaining = self._tenant_queued.get(tenant, 1) - 1
+        if remaining > 0:
+            self._tenant_queued[tenant] = remaining
+        else:
+            self._tenant_queued.pop(tenant, None)
+
+    def _forget_idle_tenant(self, tenant: str) -> None:
+        # 既没有在跑也没有排队的租户不再需要记录完成时间，下次入队从当前虚拟时间重新计；
+        # 超时/取消的排队请求也走这里，拒绝压力下字典不会随租户数无限增长
+        if tenant not in self._tenant_inflight and tenant not in self._tenant_queued:
+            self._tenant_finish.pop(tenant, None)
+
+    def _wake(self) -> None:
+        deferred = []
+        while self._waiters and self._inflight < self.limit:
+            entry = heapq.heappop(self._waiters)
+            finish, _, waiter, tenant = entry
+            if waiter.done():
+                continue
+            if self._tenant_capped(tenant):
+                deferred.append(entry)
+                continue
+            self._grant(tenant)
+            self._queued -= 1
+            self._dequeue_tenant(tenant)
+            self._vtime = max(self._vtime, finish)
+            waiter.set_result(None)
+        for entry in deferred:
+            heapq.heappush(self._waiters, entry)
 
 
 @asynccontextmanager
-async def limited(sem: Semaphore):
-    start = time.perf_counter()
-    try:
+async def limited(sem: Semaphore | AdaptiveLimiter, tenant: str | None = None):
+    if not isinstance(sem, AdaptiveLimiter):
         async with sem:
-            logger.info(f"等待了 {time.perf_counter() - start:.3f} 秒才拿到许可")
             yield
-    finally:
-        logger.info("任务结束，释放信号量")
+        return
 
+    tenant = tenant or DEFAULT_TENANT
+    start = time.perf_counter()
+    try:
+        await sem.acquire(tenant)
+    except LimiterRejected as exc:
+        metrics.limiter_rejections_total.inc(sem.name, exc.reason)
+        raise
+    acquired = time.perf_counter()
+    metrics.limiter_wait_seconds.observe(acquired - start, sem.name)
 
+    ok = True
+    try:
+        yield
+    except asyncio.CancelledError:
+        # 客户端断开不代表下游过载，不参与收缩
+        raise
+    except Exception:
+        ok = False
+        raise
+    finally:
+        held = time.perf_counter() - acquired
+        metrics.limiter_hold_seconds.observe(held, sem.name)
+        sem.release(held, ok, tenant)
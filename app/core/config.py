@@ -1,4 +1,6 @@
 from functools import lru_cache
+from typing import Literal
+
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -23,6 +25,130 @@ class Settings(BaseSettings):
     mysql_password: str = "123456"
     mysql_db: str = "test"
     mysql_echo: bool = False
+    mysql_auto_migrate: bool = Field(
+        default=False,
+        description="Create missing t_user generated columns and indexes on startup",
+    )
+    mysql_profile: bool = Field(
+        default=False,
+        description="Aggregate per-statement SQL stats and expose them on /debug/sql/top",
+    )
+    mysql_slow_query_ms: int | None = Field(
+        default=200,
+        description="With mysql_profile, log statements slower than this (ms)",
+    )
+    mysql_query_budget: int | None = Field(
+        default=None,
+        description="With mysql_profile, max SQL statements one request may execute",
+    )
+    mysql_query_budget_mode: Literal["warn", "raise"] = Field(
+        default="warn",
+        description="Log over-budget requests, or raise QueryBudgetExceeded (for tests)",
+    )
+
+    slow_request_ms: int | None = Field(
+        default=None,
+        description="Log requests slower than this (ms) with their Server-Timing breakdown",
+    )
+
+    user_count_cache_ttl: int = Field(
+        default=60,
+        description="Seconds a cached user listing total stays valid",
+    )
+    user_cache_ttl: int = Field(
+        default=300,
+        description="Base TTL in seconds for cached GET /users/{id} payloads",
+    )
+    user_cache_ttl_jitter: int = Field(
+        default=60,
+        description="Random extra seconds added to user_cache_ttl so hot keys do not expire together",
+    )
+    user_cache_negative_ttl: int = Field(
+        default=30,
+        description="TTL in seconds for cached 'user does not exist' markers",
+    )
+
+    user_batch_max: int = Field(
+        default=500,
+        description="Max users accepted by one POST /users/batch call",
+    )
+    user_import_chunk_size: int = Field(
+        default=500,
+        description="Rows per batched INSERT in POST /users/import",
+    )
+    user_import_max_line_bytes: int = Field(
+        default=64 * 1024,
+        description="Longest NDJSON line accepted by POST /users/import",
+    )
+
+    llm_stream_cache_ttl: int = Field(
+        default=300,
+        description="Seconds a completed /agents/llm stream is kept for replay",
+    )
+    llm_stream_cache_max_bytes: int = Field(
+        default=256 * 1024,
+        description="Streams larger than this are not cached",
+    )
+
+    sse_heartbeat_interval: float = Field(
+        default=15.0,
+        description="Seconds of silence before an SSE connection gets a heartbeat ping",
+    )
+    agent_stream_grace: float = Field(
+        default=30.0,
+        description="Seconds an /agents stream keeps running after its client disconnects",
+    )
+    agent_stream_buffer_bytes: int = Field(
+        default=256 * 1024,
+        description="Per-stream frame buffer kept for Last-Event-ID resume",
+    )
+
+    progress_backend: Literal["memory", "redis"] = Field(
+        default="memory",
+        description="ProgressBus backend; use redis when running more than one worker",
+    )
+    progress_buffer_trace_bytes: int = Field(
+        default=256 * 1024,
+        description="In-memory replay buffer cap per trace (bytes of event JSON)",
+    )
+    progress_buffer_total_bytes: int = Field(
+        default=64 * 1024 * 1024,
+        description="In-memory replay buffer cap across all traces",
+    )
+    progress_buffer_ttl: float = Field(
+        default=300.0,
+        description="Seconds a finished trace stays replayable in memory",
+    )
+    progress_stream_maxlen: int = Field(
+        default=1000,
+        description="Approximate max events kept in one trace's Redis stream",
+    )
+    progress_stream_ttl: int = Field(
+        default=3600,
+        description="Seconds a trace's Redis stream lives after its last event",
+    )
+
+    token_cache_size: int = Field(
+        default=10000,
+        description="Max decoded login sessions kept in the per-process L1 cache",
+    )
+    token_cache_ttl: float = Field(
+        default=30.0,
+        description="Seconds a session stays in L1 before it is re-read from Redis",
+    )
+
+    tenant_weights: dict[str, float] = Field(
+        default_factory=dict,
+        description="Fair-queuing weight per tenant (e.g. {\"user:42\": 4}); unlisted tenants weigh 1",
+    )
+    tenant_api_keys: dict[str, str] = Field(
+        default_factory=dict,
+        description="X-API-Key value -> tenant name; unknown keys are ignored for fair queuing",
+    )
+    llm_tenant_max_inflight: int | None = Field(
+        default=None,
+        description="Max concurrent LLM streams one tenant may hold; None disables the cap",
+    )
 
 
 @lru_cache
@@ -0,0 +1,83 @@
+import asyncio
+from contextlib import suppress
+import time
+from typing import Callable
+
+from loguru import logger
+
+
+# SSE 注释帧：客户端忽略，只用来保持连接和让代理不超时断开（/agents 流使用）
+PING = b": ping\n\n"
+
+
+class HeartbeatHandle:
+    """一条连接在心跳调度器里的登记；有真实数据发出时调用 touch。"""
+
+    __slots__ = ("callback", "last_sent")
+
+    def __init__(self, callback: Callable[[], None]) -> None:
+        self.callback = callback
+        # 刚建立的连接视为刚发过数据，不会马上收到 ping
+        self.last_sent = time.monotonic()
+
+    def touch(self) -> None:
+        self.last_sent = time.monotonic()
+
+
+# 每个心跳间隔内 tick 的次数；越大越接近精确的 interval，代价是多扫几遍登记表
+TICKS_PER_INTERVAL = 8
+
+
+class Heartbeat:
+    """所有 SSE 连接共用的心跳：一个周期性 tick，给快要超过 interval 没发数据的连接发 ping。
+
+    取代每个订阅者循环 wait_for(queue.get(), timeout) 的做法：等待中的连接不再各自持有
+    定时器和包装任务，空闲连接每次 tick 只多一次时间比较。没有连接时 tick 任务退出。
+
+    tick 周期为 interval / TICKS_PER_INTERVAL，连接静默达到 interval - tick 即发 ping，
+    保证任何连接的静默时间都不超过 interval。
+    """
+
+    def __init__(self, interval: float = 15.0) -> None:
+        self.interval = interval
+        self.tick = interval / TICKS_PER_INTERVAL
+        self._handles: set[HeartbeatHandle] = set()
+        self._task: asyncio.Task[None] | None = None
+        # 最近一次 tick 的墙钟时间；同一 tick 内的回调可据此共享编码好的 ping 帧
+        self.last_tick = 0.0
+
+    def __len__(self) -> int:
+        return len(self._handles)
+
+    def register(self, callback: Callable[[], None]) -> HeartbeatHandle:
+        handle = HeartbeatHandle(callback)
+        self._handles.add(handle)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return handle
+
+    def unregister(self, handle: HeartbeatHandle) -> None:
+        self._handles.discard(handle)
+
+    async def _run(self) -> None:
+        while self._handles:
+            await asyncio.sleep(self.tick)
+            self.last_tick = time.time()
+            now = time.monotonic()
+            # 下一次 tick 时会超过 interval 的连接现在就发
+            due = now - (self.interval - self.tick)
+            for handle in list(self._handles):
+                if handle.last_sent > due:
+                    continue
+                handle.last_sent = now
+                try:
+                    handle.callback()
+                except Exception:
+                    logger.exception("heartbeat callback failed")
+
+    async def close(self) -> None:
+        self._handles.clear()
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
@@ -0,0 +1,186 @@
+from bisect import bisect_left
+from collections import defaultdict
+import time
+from typing import Callable, Iterable
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+LabelValues = tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[LabelValues, float] = defaultdict(float)
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        self._values[label_values] += amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for values, total in self._values.items():
+            yield f"{self.name}{_format_labels(self.labels, values)} {total}"
+
+
+class Histogram:
+    """只在 observe 时做一次二分查找和两次加法，渲染时再累加成累计桶。"""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._counts: dict[LabelValues, list[int]] = {}
+        self._sums: dict[LabelValues, float] = defaultdict(float)
+
+    def observe(self, value: float, *label_values: str) -> None:
+        counts = self._counts.get(label_values)
+        if counts is None:
+            counts = self._counts[label_values] = [0] * (len(self.buckets) + 1)
+        counts[bisect_left(self.buckets, value)] += 1
+        self._sums[label_values] += value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for values, counts in self._counts.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _format_labels(self.labels, values, f'le="{le}"')
+                yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+            labels = _format_labels(self.labels, values)
+            yield f"{self.name}_sum{labels} {self._sums[values]}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Gauge:
+    """采集时才通过回调读取当前值，热路径上没有任何开销。"""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...],
+        collect: Callable[[], Iterable[tuple[LabelValues, float]]],
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.collect = collect
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        for values, value in self.collect():
+            yield f"{self.name}{_format_labels(self.labels, values)} {value}"
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: list[Counter | Histogram | Gauge] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# 以名字登记的限流器，采集 gauge 时读取其实时状态
+limiters: dict[str, object] = {}
+
+
+def _limiter_gauge(attr: str) -> Callable[[], Iterable[tuple[LabelValues, float]]]:
+    def collect() -> Iterable[tuple[LabelValues, float]]:
+        return [((name,), getattr(limiter, attr)) for name, limiter in limiters.items()]
+
+    return collect
+
+
+limiter_wait_seconds = registry.register(
+    Histogram("limiter_wait_seconds", "Time spent waiting for a limiter slot", ("limiter",))
+)
+limiter_hold_seconds = registry.register(
+    Histogram("limiter_hold_seconds", "Time a limiter slot was held", ("limiter",))
+)
+limiter_rejections_total = registry.register(
+    Counter("limiter_rejections_total", "Requests rejected by a limiter", ("limiter", "reason"))
+)
+registry.register(
+    Gauge("limiter_inflight", "Slots currently held", ("limiter",), _limiter_gauge("inflight"))
+)
+registry.register(
+    Gauge("limiter_queue_depth", "Requests waiting for a slot", ("limiter",), _limiter_gauge("queue_depth"))
+)
+registry.register(
+    Gauge("limiter_limit", "Current adaptive concurrency limit", ("limiter",), _limiter_gauge("limit"))
+)
+http_request_duration_seconds = registry.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "HTTP request latency until the response is complete",
+        ("method", "route", "status"),
+    )
+)
+
+
+class MetricsMiddleware:
+    """按路由模板记录请求耗时；流式响应统计到最后一个 chunk 发送完。"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = "500"
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            # 用路由模板而不是真实路径做标签，避免 /users/{id} 造成标签爆炸
+            path = getattr(route, "path", "unmatched")
+            http_request_duration_seconds.observe(
+                time.perf_counter() - start, scope["method"], path, status
+            )
@@ -0,0 +1,27 @@
+import base64
+import json
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(last_id: int, fingerprint: str) -> str:
+    """游标 = 上一页最后一条的 id + 过滤条件指纹，对客户端不透明。"""
+    raw = json.dumps({"id": last_id, "f": fingerprint}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, fingerprint: str) -> int:
+    """解析游标；过滤条件变了的游标直接视为无效，避免跨查询翻页。"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        last_id = int(data["id"])
+        cursor_fingerprint = data["f"]
+    except (ValueError, KeyError, TypeError) as exc:
+        raise InvalidCursor("游标格式错误") from exc
+
+    if cursor_fingerprint != fingerprint:
+        raise InvalidCursor("游标与当前过滤条件不匹配")
+    return last_id
@@ -0,0 +1,447 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict, deque
+from typing import Any, AsyncGenerator
+
+from loguru import logger
+from pydantic import BaseModel, Field
+from redis.asyncio import Redis
+
+from app.core.heartbeat import Heartbeat
+
+
+class ProgressEvent(BaseModel):
+    trace_id: str
+    seq: int
+    stage: str
+    progress: int
+    message: str
+    ts: float
+    done: bool = False
+    error: str | None = None
+    meta: dict[str, Any] = Field(default_factory=dict)
+
+
+def sse_pack(event: str, data: dict[str, Any], event_id: int | None = None) -> str:
+    lines: list[str] = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+
+class ProgressFrame:
+    """一条已编码好的 SSE 帧；同一个对象被放进所有订阅者队列和补发缓冲。"""
+
+    __slots__ = ("trace_id", "seq", "terminal", "data", "_mux_data")
+
+    def __init__(self, trace_id: str, seq: int, terminal: bool, data: bytes) -> None:
+        self.trace_id = trace_id
+        self.seq = seq
+        self.terminal = terminal
+        self.data = data
+        self._mux_data: bytes | None = None
+
+    @property
+    def mux_data(self) -> bytes:
+        """多路订阅使用的帧：id 改为 "<trace_id>:<seq>"，首次使用时生成一次后共享。"""
+        if self._mux_data is None:
+            if not self.seq:
+                # ping 帧没有 id 行，原样使用
+                self._mux_data = self.data
+            else:
+                _, _, rest = self.data.partition(b"\n")
+                self._mux_data = f"id: {self.trace_id}:{self.seq}\n".encode() + rest
+        return self._mux_data
+
+
+def encode_frame(
+    trace_id: str, event_json: str, seq: int, done: bool, error: str | None
+) -> ProgressFrame:
+    name = "error" if error else ("done" if done else "progress")
+    data = f"id: {seq}\nevent: {name}\ndata: {event_json}\n\n".encode()
+    return ProgressFrame(trace_id, seq, bool(done or error), data)
+
+
+def ping_frame(trace_id: str, ts: float) -> ProgressFrame:
+    data = sse_pack("ping", {"event": "ping", "trace_id": trace_id, "ts": ts})
+    return ProgressFrame(trace_id, 0, False, data.encode())
+
+
+# 心跳放进订阅队列的占位：订阅者取到后再输出各 trace 的 ping 帧
+_PING_REQUEST = ProgressFrame("", 0, False, b"")
+
+
+class _TraceState:
+    """单个 trace 的全部状态：订阅者、seq 计数和最近帧的环形缓冲。"""
+
+    __slots__ = ("subs", "seq", "frames", "nbytes", "done_at", "ping")
+
+    def __init__(self) -> None:
+        self.subs: set[asyncio.Queue[ProgressFrame]] = set()
+        self.seq = 0
+        self.frames: deque[ProgressFrame] = deque()
+        self.nbytes = 0
+        self.done_at: float | None = None
+        # (心跳 tick 时间, 编码好的 ping 帧)，同一 tick 的订阅者共享
+        self.ping: tuple[float, ProgressFrame] | None = None
+
+    def popleft(self) -> int:
+        size = len(self.frames.popleft().data)
+        self.nbytes -= size
+        return size
+
+    def since(self, last_seq: int) -> list[ProgressFrame]:
+        return [frame for frame in self.frames if frame.seq > last_seq]
+
+
+def _drop_oldest(queue: asyncio.Queue[ProgressFrame]) -> None:
+    """队列满时丢掉最旧的非结束帧，其余帧保持原有顺序。
+
+    多路订阅中各 trace 共用一个队列，done/error 帧决定订阅何时退出，
+    不能被别的 trace 的新帧挤掉；溢出是慢路径，整体重排的开销可以接受。
+    """
+    items: list[ProgressFrame] = []
+    while not queue.empty():
+        items.append(queue.get_nowait())
+    for index, item in enumerate(items):
+        if not item.terminal:
+            del items[index]
+            break
+    for item in items:
+        queue.put_nowait(item)
+
+
+def _fanout(state: _TraceState, frame: ProgressFrame) -> None:
+    for queue in state.subs:
+        if queue.full():
+            _drop_oldest(queue)
+        if not queue.full():
+            queue.put_nowait(frame)
+
+
+def _offer_ping(queue: asyncio.Queue[ProgressFrame]) -> None:
+    # 队列里有积压说明连接并不空闲，丢掉这次 ping 即可
+    if queue.empty():
+        queue.put_nowait(_PING_REQUEST)
+
+
+class ProgressBus:
+    """进程内的进度总线：trace_id -> 订阅者队列，只适用于单 worker。
+
+    每个 trace 保留最近事件的环形缓冲，晚到或断线重连的订阅者可按 Last-Event-ID（seq）
+    补发；单 trace 和全部缓冲分别有字节上限，trace 结束 buffer_ttl 秒后整体回收。
+
+    publish 中间没有 await，状态按 trace 拆开后不需要任何锁；事件只编码一次成 SSE
+    bytes，所有订阅者共享同一个 ProgressFrame，开销与订阅者数量基本无关。
+    """
+
+    def __init__(
+        self,
+        *,
+        trace_buffer_bytes: int = 256 * 1024,
+        total_buffer_bytes: int = 64 * 1024 * 1024,
+        buffer_ttl: float = 300.0,
+        heartbeat: Heartbeat | None = None,
+    ) -> None:
+        self.trace_buffer_bytes = trace_buffer_bytes
+        self.total_buffer_bytes = total_buffer_bytes
+        self.buffer_ttl = buffer_ttl
+        self.heartbeat = heartbeat
+        # 按最近写入排序，总量超限时从最久未更新的 trace 开始淘汰
+        self._traces: OrderedDict[str, _TraceState] = OrderedDict()
+        # (结束时间, trace_id)，按结束先后排列，过期回收只看队头
+        self._done_order: deque[tuple[float, str]] = deque()
+        self._buffered_bytes = 0
+
+    def _state(self, trace_id: str) -> _TraceState:
+        state = self._traces.get(trace_id)
+        if state is None:
+            state = self._traces[trace_id] = _TraceState()
+        return state
+
+    async def publish(self, trace_id: str, payload: dict[str, Any]) -> None:
+        now = time.monotonic()
+        self._evict_expired(now)
+
+        state = self._state(trace_id)
+        self._traces.move_to_end(trace_id)
+        state.seq += 1
+        event = ProgressEvent(trace_id=trace_id, seq=state.seq, **payload)
+        frame = encode_frame(
+            trace_id, event.model_dump_json(), event.seq, event.done, event.error
+        )
+
+        state.frames.append(frame)
+        state.nbytes += len(frame.data)
+        self._buffered_bytes += len(frame.data)
+        if frame.terminal:
+            self._mark_done(trace_id, state, now)
+        self._enforce_caps(state)
+
+        _fanout(state, frame)
+
+    def _mark_done(self, trace_id: str, state: _TraceState, now: float) -> None:
+        if state.done_at is None:
+            state.done_at = now
+            self._done_order.append((now, trace_id))
+
+    def _enforce_caps(self, current: _TraceState) -> None:
+        while current.nbytes > self.trace_buffer_bytes and len(current.frames) > 1:
+            self._buffered_bytes -= current.popleft()
+        while self._buffered_bytes > self.total_buffer_bytes:
+            oldest_id, oldest = next(iter(self._traces.items()))
+            if oldest is current and len(current.frames) <= 1:
+                break
+            if oldest.frames:
+                self._buffered_bytes -= oldest.popleft()
+            if not oldest.frames:
+                self._drop(oldest_id)
+
+    def _evict_expired(self, now: float) -> None:
+        while self._done_order and now - self._done_order[0][0] > self.buffer_ttl:
+            done_at, trace_id = self._done_order.popleft()
+            state = self._traces.get(trace_id)
+            # 同名 trace 可能已被淘汰后重建，只回收对应这次结束的状态
+            if state is not None and state.done_at == done_at:
+                self._drop(trace_id)
+
+    def _drop(self, trace_id: str) -> None:
+        state = self._traces.get(trace_id)
+        if state is None:
+            return
+        self._buffered_bytes -= state.nbytes
+        state.frames.clear()
+        state.nbytes = 0
+        if state.subs:
+            # 仍有订阅者时保留 seq，只清空缓冲；放到队尾避免总量淘汰时反复扫到
+            self._traces.move_to_end(trace_id)
+        else:
+            del self._traces[trace_id]
+
+    def _ping(self, trace_id: str) -> ProgressFrame:
+        """同一次心跳 tick 内，同一 trace 的所有订阅者共享一个编码好的 ping 帧。"""
+        ts = self.heartbeat.last_tick if self.heartbeat is not None else time.time()
+        state = self._traces.get(trace_id)
+        if state is None:
+            return ping_frame(trace_id, ts)
+        if state.ping is None or state.ping[0] != ts:
+            state.ping = (ts, ping_frame(trace_id, ts))
+        return state.ping[1]
+
+    async def cleanup_trace(self, trace_id: str) -> None:
+        """Start the replay TTL for a finished trace; state is dropped once it expires."""
+        state = self._traces.get(trace_id)
+        if state is None:
+            return
+        if not state.frames and not state.subs:
+            del self._traces[trace_id]
+        else:
+            self._mark_done(trace_id, state, time.monotonic())
+
+    async def _attach(
+        self, trace_id: str, queue: asyncio.Queue[ProgressFrame], last_event_id: int
+    ) -> list[ProgressFrame]:
+        """登记订阅队列并返回需要补发的帧；中间没有 await，不会漏也不会重复。"""
+        state = self._state(trace_id)
+        state.subs.add(queue)
+        return state.since(last_event_id)
+
+    async def _detach(self, trace_id: str, queue: asyncio.Queue[ProgressFrame]) -> None:
+        state = self._traces.get(trace_id)
+        if state is None:
+            return
+        state.subs.discard(queue)
+        if not state.subs and not state.frames:
+            del self._traces[trace_id]
+
+    async def subscribe(
+        self, trace_id: str, last_event_id: int = 0
+    ) -> AsyncGenerator[ProgressFrame, None]:
+        """订阅 trace 的进度；先补发 seq > last_event_id 的缓冲帧，再推送实时帧。"""
+        async for frame in self.subscribe_many([trace_id], {trace_id: last_event_id}):
+            yield frame
+
+    async def subscribe_many(
+        self, trace_ids: list[str], since: dict[str, int] | None = None
+    ) -> AsyncGenerator[ProgressFrame, None]:
+        """在一个队列上同时订阅多个 trace，全部结束（done/error）后退出。
+
+        since 为各 trace 已收到的 seq；每个 trace 先补发缓冲帧，再推送实时帧。
+        帧按 trace 各自去重，结束的 trace 立即退订。
+        """
+        since = since or {}
+        queue: asyncio.Queue[ProgressFrame] = asyncio.Queue(maxsize=max(200, 50 * len(trace_ids)))
+        last_seq = {trace_id: since.get(trace_id, 0) for trace_id in trace_ids}
+        remaining = set(trace_ids)
+        beat = (
+            self.heartbeat.register(lambda: _offer_ping(queue))
+            if self.heartbeat is not None
+            else None
+        )
+
+        try:
+            replay: list[ProgressFrame] = []
+            for trace_id in trace_ids:
+                replay.extend(await self._attach(trace_id, queue, last_seq[trace_id]))
+
+            for frame in replay:
+                if frame.trace_id not in remaining or frame.seq <= last_seq[frame.trace_id]:
+                    continue
+                last_seq[frame.trace_id] = frame.seq
+                yield frame
+                if frame.terminal:
+                    remaining.discard(frame.trace_id)
+                    await self._detach(frame.trace_id, queue)
+
+            while remaining:
+                # 空闲时由共享心跳往队列里塞 _PING_REQUEST，这里不再需要超时
+                frame = await queue.get()
+                if frame is _PING_REQUEST:
+                    for trace_id in remaining:
+                        yield self._ping(trace_id)
+                    continue
+
+                # 补发与实时推送可能重叠（Redis 后端），按 seq 去重
+                if frame.trace_id not in remaining or frame.seq <= last_seq[frame.trace_id]:
+                    continue
+                last_seq[frame.trace_id] = frame.seq
+                if beat is not None:
+                    beat.touch()
+                yield frame
+                if frame.terminal:
+                    remaining.discard(frame.trace_id)
+                    await self._detach(frame.trace_id, queue)
+        finally:
+            if beat is not None:
+                self.heartbeat.unregister(beat)
+            for trace_id in remaining:
+                await self._detach(trace_id, queue)
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisProgressBus(ProgressBus):
+    """基于 Redis Streams 的跨进程进度总线，publish/subscribe 接口与 ProgressBus 相同。
+
+    - 每个 trace 一个 stream，XADD 时按 MAXLEN 近似截断，并随每次写入续期 TTL；
+      stream 本身就是补发缓冲，订阅时用 XRANGE 读出 seq > last_event_id 的事件
+    - seq 用 INCR 生成，多个进程向同一 trace 发布时仍然单调
+    - 每个进程只有一个读协程，用 XREAD BLOCK 同时读取本进程所有被订阅的 stream，
+      每条事件编码成帧一次后分发给本地队列；没有订阅者时读协程退出
+    """
+
+    STREAM_PREFIX = "progress:stream:"
+    SEQ_PREFIX = "progress:seq:"
+
+    def __init__(
+        self,
+        redis: Redis,
+        *,
+        maxlen: int = 1000,
+        ttl: int = 3600,
+        block_ms: int = 250,
+        heartbeat: Heartbeat | None = None,
+    ) -> None:
+        super().__init__(heartbeat=heartbeat)
+        self.redis = redis
+        self.maxlen = maxlen
+        self.ttl = ttl
+        self.block_ms = block_ms
+        # trace_id -> 本进程已读到的 stream 位置
+        self._cursors: dict[str, str] = {}
+        self._reader: asyncio.Task[None] | None = None
+
+    def _stream_key(self, trace_id: str) -> str:
+        return f"{self.STREAM_PREFIX}{trace_id}"
+
+    @staticmethod
+    def _decode(fields: dict[str, str]) -> ProgressFrame:
+        event_json = fields["e"]
+        event = json.loads(event_json)
+        return encode_frame(
+            event["trace_id"], event_json, event["seq"], event.get("done"), event.get("error")
+        )
+
+    async def publish(self, trace_id: str, payload: dict[str, Any]) -> None:
+        seq_key = f"{self.SEQ_PREFIX}{trace_id}"
+        seq = await self.redis.incr(seq_key)
+        event = ProgressEvent(trace_id=trace_id, seq=seq, **payload)
+
+        stream_key = self._stream_key(trace_id)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.xadd(
+                stream_key, {"e": event.model_dump_json()}, maxlen=self.maxlen, approximate=True
+            )
+            pipe.expire(stream_key, self.ttl)
+            pipe.expire(seq_key, self.ttl)
+            await pipe.execute()
+
+    async def cleanup_trace(self, trace_id: str) -> None:
+        # 其它进程可能仍在订阅，stream 交给 TTL 回收
+        pass
+
+    async def _attach(
+        self, trace_id: str, queue: asyncio.Queue[ProgressFrame], last_event_id: int
+    ) -> list[ProgressFrame]:
+        self._state(trace_id).subs.add(queue)
+        # 先登记队列再读历史：之后写入的事件由读协程推送，与历史重叠的部分在 subscribe 里按 seq 去重
+        entries = await self.redis.xrange(self._stream_key(trace_id))
+        if trace_id in self._traces:
+            # 从订阅时 stream 的末尾开始读；用具体 id 而不是 "$"，读协程两次 XREAD 之间的事件不会丢
+            self._cursors.setdefault(trace_id, entries[-1][0] if entries else "0-0")
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.create_task(self._read_loop())
+
+        replay = [self._decode(fields) for _, fields in entries]
+        return [frame for frame in replay if frame.seq > last_event_id]
+
+    async def _detach(self, trace_id: str, queue: asyncio.Queue[ProgressFrame]) -> None:
+        state = self._traces.get(trace_id)
+        if state is None:
+            return
+        state.subs.discard(queue)
+        if not state.subs:
+            del self._traces[trace_id]
+            self._cursors.pop(trace_id, None)
+
+    async def _read_loop(self) -> None:
+        while True:
+            streams = {
+                self._stream_key(trace_id): cursor for trace_id, cursor in self._cursors.items()
+            }
+            if not streams:
+                if not self._traces:
+                    return
+                # 订阅刚登记、游标还没就绪
+                await asyncio.sleep(0.01)
+                continue
+
+            try:
+                result = await self.redis.xread(streams, block=self.block_ms)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("progress stream read failed, retrying")
+                await asyncio.sleep(1)
+                continue
+
+            for stream_key, entries in result or []:
+                trace_id = stream_key[len(self.STREAM_PREFIX):]
+                state = self._traces.get(trace_id)
+                if state is None or trace_id not in self._cursors:
+                    continue
+                for entry_id, fields in entries:
+                    self._cursors[trace_id] = entry_id
+                    _fanout(state, self._decode(fields))
+
+    async def close(self) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+            try:
+                await self._reader
+            except asyncio.CancelledError:
+                pass
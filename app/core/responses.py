@@ -0,0 +1,22 @@
+from typing import Any
+
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+from app.core import timing
+
+
+class ModelResponse(Response):
+    """直接用 pydantic-core 把模型序列化为 JSON bytes。
+
+    路由返回 Response 实例时 FastAPI 不会再按 response_model 校验一遍，
+    也跳过 jsonable_encoder + json.dumps；response_model 仍保留用于生成文档。
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        with timing.timed("ser"):
+            if isinstance(content, BaseModel):
+                return content.__pydantic_serializer__.to_json(content)
+            return super().render(content)
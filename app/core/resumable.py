@@ -0,0 +1,219 @@
+import asyncio
+from collections import deque
+from contextlib import suppress
+from typing import AsyncIterator
+import uuid
+
+from loguru import logger
+
+from app.core.heartbeat import PING, Heartbeat, HeartbeatHandle
+from app.core.streaming import sse_data
+
+
+_PING_TEXT = PING.decode()
+
+
+class OffsetExpired(Exception):
+    """请求续传的位置已经被挤出缓冲，无法从该处继续。"""
+
+
+class _Listener:
+    """一个连着的客户端：有新帧或需要心跳时被唤醒。"""
+
+    __slots__ = ("wake", "ping", "beat")
+
+    def __init__(self) -> None:
+        self.wake = asyncio.Event()
+        self.ping = False
+        self.beat: HeartbeatHandle | None = None
+
+    def request_ping(self) -> None:
+        self.ping = True
+        self.wake.set()
+
+
+class ResumableStream:
+    """在独立任务里把上游读进有界帧缓冲，客户端断开后上游继续跑一段宽限期。
+
+    每帧编号（offset）从 1 开始，SSE id 为 "<stream_id>:<offset>"，浏览器 EventSource
+    自动重连时带回的 Last-Event-ID 就足以定位续传位置。
+    """
+
+    def __init__(self, stream_id: str, max_buffer_bytes: int, owner: str | None = None) -> None:
+        self.id = stream_id
+        # 发起请求的租户，只有同一租户可以续传；流 id 会出现在响应头和每帧的 id 里
+        self.owner = owner
+        self.max_buffer_bytes = max_buffer_bytes
+        # (offset, 已编码好的 SSE 帧)
+        self.frames: deque[tuple[int, str]] = deque()
+        self.buffer_bytes = 0
+        self.last_offset = 0
+        self.done = False
+        self.error: str | None = None
+        self.task: asyncio.Task[None] | None = None
+        self.expiry: asyncio.TimerHandle | None = None
+        self._listeners: set[_Listener] = set()
+
+    @property
+    def listeners(self) -> int:
+        return len(self._listeners)
+
+    @property
+    def first_offset(self) -> int:
+        return self.frames[0][0] if self.frames else self.last_offset + 1
+
+    def can_resume(self, offset: int) -> bool:
+        # 客户端已收到 offset，需要的下一帧必须还在缓冲里
+        return offset + 1 >= self.first_offset and offset <= self.last_offset
+
+    def _notify(self) -> None:
+        for listener in self._listeners:
+            listener.wake.set()
+
+    def append(self, text: str) -> None:
+        self.last_offset += 1
+        frame = f"id: {self.id}:{self.last_offset}\n{sse_data(text)}"
+        self.frames.append((self.last_offset, frame))
+        self.buffer_bytes += len(frame)
+        while self.buffer_bytes > self.max_buffer_bytes and len(self.frames) > 1:
+            _, dropped = self.frames.popleft()
+            self.buffer_bytes -= len(dropped)
+        self._notify()
+
+    def finish(self, error: str | None = None) -> None:
+        self.done = True
+        self.error = error
+        self._notify()
+
+    async def frames_after(self, offset: int, listener: _Listener) -> AsyncIterator[str]:
+        self._listeners.add(listener)
+        try:
+            while True:
+                listener.wake.clear()
+                if offset + 1 < self.first_offset:
+                    # 读得太慢，未读的帧已被挤出缓冲
+                    raise OffsetExpired(f"{self.id}:{offset}")
+                pending = [item for item in self.frames if item[0] > offset]
+                if pending:
+                    for frame_offset, frame in pending:
+                        offset = frame_offset
+                        if listener.beat is not None:
+                            listener.beat.touch()
+                        yield frame
+                    # 输出期间可能有新帧写入或旧帧被挤出，重新检查后再判断是否结束
+                    continue
+                if self.done:
+                    if self.error is not None:
+                        yield f"event: error\n{sse_data(self.error)}"
+                    return
+                if listener.ping:
+                    listener.ping = False
+                    yield _PING_TEXT
+                    continue
+                await listener.wake.wait()
+        finally:
+            self._listeners.discard(listener)
+
+
+class StreamRegistry:
+    """进程内可续传流的登记表。
+
+    - 没有客户端连着时，grace 秒后取消上游并回收；期间重连即可续传
+    - 上游结束后缓冲同样保留 grace 秒，供最后一段没收到的客户端补齐
+    """
+
+    def __init__(
+        self,
+        *,
+        grace: float = 30.0,
+        max_buffer_bytes: int = 256 * 1024,
+        heartbeat: Heartbeat | None = None,
+    ) -> None:
+        self.grace = grace
+        self.max_buffer_bytes = max_buffer_bytes
+        self.heartbeat = heartbeat
+        self._streams: dict[str, ResumableStream] = {}
+
+    def get(self, stream_id: str) -> ResumableStream | None:
+        return self._streams.get(stream_id)
+
+    def get_owned(self, stream_id: str, owner: str | None) -> ResumableStream | None:
+        """按 id 取流，且必须属于 owner；不属于时与不存在一样返回 None，不泄露流是否存在。"""
+        stream = self._streams.get(stream_id)
+        if stream is None or stream.owner != owner:
+            return None
+        return stream
+
+    def start(self, source: AsyncIterator[str], owner: str | None = None) -> ResumableStream:
+        stream = ResumableStream(uuid.uuid4().hex[:16], self.max_buffer_bytes, owner)
+        self._streams[stream.id] = stream
+        stream.task = asyncio.create_task(self._pump(stream, source))
+        return stream
+
+    async def _pump(self, stream: ResumableStream, source: AsyncIterator[str]) -> None:
+        try:
+            async for text in source:
+                stream.append(text)
+        except asyncio.CancelledError:
+            stream.finish("cancelled")
+            raise
+        except Exception as exc:
+            logger.warning(f"resumable stream {stream.id} failed: {exc!r}")
+            stream.finish(str(exc))
+        else:
+            stream.finish()
+        finally:
+            aclose = getattr(source, "aclose", None)
+            if aclose is not None:
+                with suppress(Exception):
+                    await aclose()
+            if stream.listeners == 0:
+                self._schedule_expiry(stream)
+
+    async def attach(self, stream: ResumableStream, offset: int = 0) -> AsyncIterator[str]:
+        """从 offset 之后开始输出帧；调用方先用 can_resume 检查位置是否仍有效。"""
+        listener = _Listener()
+        if self.heartbeat is not None:
+            listener.beat = self.heartbeat.register(listener.request_ping)
+        if stream.expiry is not None:
+            stream.expiry.cancel()
+            stream.expiry = None
+        try:
+            async for frame in stream.frames_after(offset, listener):
+                yield frame
+        except OffsetExpired:
+            # 连接还在但读得太慢，未读的帧已被挤出缓冲；用 SSE 帧告知客户端，而不是直接断开
+            logger.info(f"resumable stream {stream.id} reader fell behind the buffer")
+            message = "读取过慢，未读内容已被挤出缓冲，请重新发起请求"
+            yield f"event: error\n{sse_data(message)}"
+        finally:
+            if listener.beat is not None:
+                self.heartbeat.unregister(listener.beat)
+            if stream.listeners == 0:
+                self._schedule_expiry(stream)
+
+    def _schedule_expiry(self, stream: ResumableStream) -> None:
+        if stream.expiry is not None or self._streams.get(stream.id) is not stream:
+            return
+        loop = asyncio.get_running_loop()
+        stream.expiry = loop.call_later(self.grace, self._expire, stream)
+
+    def _expire(self, stream: ResumableStream) -> None:
+        stream.expiry = None
+        if stream.listeners:
+            return
+        if stream.task is not None and not stream.task.done():
+            logger.info(f"resumable stream {stream.id} abandoned, cancelling upstream")
+            stream.task.cancel()
+        self._streams.pop(stream.id, None)
+
+    async def close(self) -> None:
+        streams = list(self._streams.values())
+        self._streams.clear()
+        for stream in streams:
+            if stream.expiry is not None:
+                stream.expiry.cancel()
+            if stream.task is not None:
+                stream.task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await stream.task
@@ -0,0 +1,171 @@
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+import math
+import re
+import time
+from typing import Literal
+
+from loguru import logger
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+BudgetMode = Literal["warn", "raise"]
+
+# 每个指纹保留最近这么多条耗时用于估算 p99
+_SAMPLE_SIZE = 1024
+
+_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_VALUES = re.compile(r"(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+")
+_PLACEHOLDER = re.compile(r"%s|%\(\w+\)s|:\w+")
+_SPACES = re.compile(r"\s+")
+
+
+def fingerprint(statement: str) -> str:
+    """把 SQL 归一化成指纹：字面量/占位符换成 ?，IN 列表和多行 VALUES 折叠成一个。"""
+    sql = _STRING.sub("?", statement)
+    sql = _PLACEHOLDER.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _IN_LIST.sub("IN (...)", sql)
+    sql = _VALUES.sub(r"\1, ...", sql)
+    return _SPACES.sub(" ", sql).strip()
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """单个请求执行的 SQL 条数超过预算（raise 模式）。"""
+
+
+@dataclass
+class _Budget:
+    limit: int
+    mode: BudgetMode
+    count: int = 0
+    fingerprints: list[str] = field(default_factory=list)
+
+
+_budget: ContextVar[_Budget | None] = ContextVar("sql_query_budget", default=None)
+
+
+@contextmanager
+def query_budget(limit: int, mode: BudgetMode = "warn"):
+    """限制块内（通常是一个请求）执行的 SQL 条数，用于发现 N+1 和多余往返。
+
+    raise 模式下第 limit+1 条 SQL 执行前抛 QueryBudgetExceeded，适合测试；
+    warn 模式只在块结束时打一条带指纹列表的告警。
+    """
+    budget = _Budget(limit, mode)
+    token = _budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _budget.reset(token)
+        if budget.mode == "warn" and budget.count > budget.limit:
+            logger.warning(
+                f"query budget exceeded: {budget.count} > {budget.limit} {budget.fingerprints}"
+            )
+
+
+class QueryStats:
+    __slots__ = ("count", "total", "rows", "samples")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.rows = 0
+        self.samples: deque[float] = deque(maxlen=_SAMPLE_SIZE)
+
+    def p99(self) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, math.ceil(len(ordered) * 0.99) - 1)]
+
+
+class SqlProfiler:
+    """按指纹聚合 SQL 的次数、总耗时、p99 和返回行数，并记录慢查询。
+
+    通过 attach 挂到引擎的 cursor 执行事件上；不开启时完全没有开销。
+    """
+
+    def __init__(self, slow_query_ms: int | None = None) -> None:
+        self.slow_query_ms = slow_query_ms
+        self._stats: dict[str, QueryStats] = {}
+
+    def attach(self, engine: AsyncEngine) -> None:
+        sync_engine = engine.sync_engine
+        event.listen(sync_engine, "before_cursor_execute", self._before)
+        event.listen(sync_engine, "after_cursor_execute", self._after)
+        event.listen(sync_engine, "handle_error", self._error)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        budget = _budget.get()
+        if budget is not None:
+            budget.count += 1
+            budget.fingerprints.append(fingerprint(statement))
+            if budget.count > budget.limit and budget.mode == "raise":
+                raise QueryBudgetExceeded(
+                    f"{budget.count} queries > budget {budget.limit}: {budget.fingerprints}"
+                )
+        conn.info.setdefault("profiler_start", []).append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["profiler_start"].pop()
+        key = fingerprint(statement)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = QueryStats()
+        stats.count += 1
+        stats.total += elapsed
+        stats.samples.append(elapsed)
+        rowcount = getattr(cursor, "rowcount", -1)
+        if rowcount and rowcount > 0:
+            stats.rows += rowcount
+        if self.slow_query_ms is not None and elapsed * 1000 >= self.slow_query_ms:
+            logger.warning(f"slow query {elapsed * 1000:.1f}ms: {key}")
+
+    def _error(self, exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("profiler_start"):
+            conn.info["profiler_start"].pop()
+
+    def top(
+        self, n: int = 20, order_by: Literal["total", "count", "p99", "rows"] = "total"
+    ) -> list[dict]:
+        rows = [
+            {
+                "fingerprint": key,
+                "count": stats.count,
+                "total_ms": round(stats.total * 1000, 3),
+                "avg_ms": round(stats.total * 1000 / stats.count, 3),
+                "p99_ms": round(stats.p99() * 1000, 3),
+                "rows": stats.rows,
+            }
+            for key, stats in list(self._stats.items())
+        ]
+        sort_key = {"total": "total_ms", "count": "count", "p99": "p99_ms", "rows": "rows"}[order_by]
+        rows.sort(key=lambda row: row[sort_key], reverse=True)
+        return rows[:n]
+
+    def reset(self) -> None:
+        self._stats.clear()
+
+
+class QueryBudgetMiddleware:
+    """给每个 HTTP 请求套上 query_budget。"""
+
+    def __init__(self, app: ASGIApp, limit: int, mode: BudgetMode = "warn") -> None:
+        self.app = app
+        self.limit = limit
+        self.mode = mode
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with query_budget(self.limit, self.mode):
+            await self.app(scope, receive, send)
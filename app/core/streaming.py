@@ -0,0 +1,101 @@
+import asyncio
+from contextlib import suppress
+import json
+from typing import AsyncIterator, Callable
+
+
+def sse_data(text: str) -> str:
+    """把一段文本封装成 SSE data 帧；多行文本按协议拆成多条 data 行。"""
+    return "".join(f"data: {line}\n" for line in text.split("\n")) + "\n"
+
+
+def sse_json(build: Callable[[str], dict]) -> Callable[[str], str]:
+    """生成 JSON 负载的 framer：每次 flush 只做一次 json.dumps。"""
+
+    def framer(text: str) -> str:
+        return f"data: {json.dumps(build(text), ensure_ascii=False)}\n\n"
+
+    return framer
+
+
+async def coalesce_sse(
+    source: AsyncIterator[str],
+    *,
+    max_bytes: int = 2048,
+    max_delay: float = 0.1,
+    high_water: int | None = None,
+    framer: Callable[[str], str] = sse_data,
+) -> AsyncIterator[str]:
+    """把上游逐字/逐 token 的小 chunk 合并后再按 SSE 封帧输出。
+
+    - 第一个 chunk 到达立即发送，首 token 延迟不变
+    - 之后每批从首个 chunk 到达起最多攒 max_delay 秒，或累计到 max_bytes 立即发送
+    - 上游由独立的 pump 协程读取，下游写 socket 慢时上游可以先攒一批；
+      积压超过 high_water（默认 4 * max_bytes）后 pump 暂停读取，背压传回上游
+    """
+    if high_water is None:
+        high_water = 4 * max_bytes
+    buffer: list[str] = []
+    size = 0
+    finished = False
+    error: BaseException | None = None
+    # ready：该 flush 了；drained：下游取走了积压，pump 可以继续读
+    ready = asyncio.Event()
+    drained = asyncio.Event()
+    # 每批只登记一个 call_at 截止时间，不为每个 chunk 建任务和定时器
+    deadline: asyncio.TimerHandle | None = None
+    loop = asyncio.get_running_loop()
+
+    async def pump() -> None:
+        nonlocal size, finished, error, deadline
+        immediate = True
+        try:
+            async for chunk in source:
+                if not buffer:
+                    if immediate:
+                        immediate = False
+                        ready.set()
+                    elif deadline is None:
+                        deadline = loop.call_at(loop.time() + max_delay, ready.set)
+                buffer.append(chunk)
+                size += len(chunk.encode())
+                if size >= max_bytes:
+                    ready.set()
+                while size >= high_water:
+                    drained.clear()
+                    await drained.wait()
+        except Exception as exc:
+            error = exc
+        finally:
+            finished = True
+            ready.set()
+
+    task = asyncio.create_task(pump())
+    try:
+        while True:
+            if not finished:
+                await ready.wait()
+            ready.clear()
+            if deadline is not None:
+                deadline.cancel()
+                deadline = None
+
+            if buffer:
+                text = "".join(buffer)
+                buffer.clear()
+                size = 0
+                drained.set()
+                yield framer(text)
+            elif finished:
+                if error is not None:
+                    raise error
+                return
+    finally:
+        if deadline is not None:
+            deadline.cancel()
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+        aclose = getattr(source, "aclose", None)
+        if aclose is not None:
+            await aclose()
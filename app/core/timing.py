@@ -0,0 +1,138 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import time
+
+from loguru import logger
+from redis.asyncio import Redis
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+# 当前请求各分类的累计耗时（秒）；不在请求内时为 None，记录直接忽略
+_timings: ContextVar[dict[str, float] | None] = ContextVar("server_timings", default=None)
+
+# Server-Timing 中各分类的说明，顺序即输出顺序
+CATEGORIES = {
+    "db_conn": "MySQL connection checkout",
+    "db": "MySQL queries",
+    "redis": "Redis commands",
+    "ser": "Serialization",
+}
+
+
+def record(category: str, seconds: float) -> None:
+    timings = _timings.get()
+    if timings is not None:
+        timings[category] = timings.get(category, 0.0) + seconds
+
+
+@contextmanager
+def timed(category: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(category, time.perf_counter() - start)
+
+
+def format_server_timing(timings: dict[str, float], total: float) -> str:
+    parts = []
+    for category, desc in CATEGORIES.items():
+        if category in timings:
+            parts.append(f'{category};dur={timings[category] * 1000:.1f};desc="{desc}"')
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """在底层同步引擎上挂 cursor 执行事件，统计每条 SQL 的耗时。
+
+    SQLAlchemy 的 greenlet 会继承调用方的 contextvars，事件里能拿到当前请求。
+    """
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("timing_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        record("db", time.perf_counter() - conn.info["timing_start"].pop())
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(exception_context):
+        # 出错时 after_cursor_execute 不会触发，丢弃未配对的起始时间
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("timing_start"):
+            record("db", time.perf_counter() - conn.info["timing_start"].pop())
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """连接池取连接时计时（含排队等空闲连接和新建连接）。
+
+    只在 session 第一次真正执行 SQL 时才会取连接，只读 Redis 缓存的请求不占池子。
+    recreate() 按 self.__class__ 重建，dispose 之后依然生效。
+    """
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            record("db_conn", time.perf_counter() - start)
+
+
+class TimedRedis(Redis):
+    """所有单条命令都经过 execute_command，在这里计时即可覆盖全部调用点。"""
+
+    async def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            record("redis", time.perf_counter() - start)
+
+
+class ServerTimingMiddleware:
+    """为每个请求累计各分类耗时，写入 Server-Timing 响应头。
+
+    响应头在 http.response.start 时写出，流式响应只包含开始发送前的耗时；
+    超过 slow_request_ms 的请求在响应结束后按完整耗时打一条日志。
+    """
+
+    def __init__(self, app: ASGIApp, slow_request_ms: int | None = None) -> None:
+        self.app = app
+        self.slow_request_ms = slow_request_ms
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: dict[str, float] = {}
+        token = _timings.set(timings)
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "Server-Timing",
+                    format_server_timing(timings, time.perf_counter() - start),
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _timings.reset(token)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if self.slow_request_ms is not None and elapsed_ms >= self.slow_request_ms:
+                breakdown = " ".join(f"{k}={v * 1000:.1f}ms" for k, v in timings.items())
+                logger.warning(
+                    f"slow request {scope['method']} {scope['path']} "
+                    f"{elapsed_ms:.1f}ms {breakdown}"
+                )
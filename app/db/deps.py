@@ -1,5 +1,4 @@
 from collections.abc import AsyncGenerator
-import json
 from typing import Annotated, Any
 
 from fastapi import Depends, HTTPException, Request, Security
@@ -9,6 +8,9 @@ from loguru import logger
 from redis.asyncio import Redis
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.config import get_settings
+from app.services import auth_service
+
 
 async def get_mysql_session(request: Request) -> AsyncGenerator[AsyncSession, None]:
     session_factory = request.app.state.mysql_session_factory
@@ -23,26 +25,56 @@ def get_redis(request: Request) -> Redis:
 api_key_header = APIKeyHeader(name="Authorization", auto_error=False)
 
 
+def _strip_bearer(token: str) -> str:
+    token = token.strip()
+    if token.lower().startswith("bearer "):
+        token = token[7:].strip()
+    return token
+
+
 async def get_current_user_from_token(
+    request: Request,
     redis: Annotated[Redis, Depends(get_redis)],
     token: Annotated[str | None, Security(api_key_header)],
 ) -> dict[str, Any]:
     if token is None:
         raise HTTPException(status_code=401, detail="未登录或令牌无效")
-    token = token.strip()
-    if token.lower().startswith("bearer "):
-        token = token[7:].strip()
+    token = _strip_bearer(token)
 
     logger.info("auth token: %s", token)
 
     if not token:
         raise HTTPException(status_code=401, detail="未登录或令牌无效")
 
-    user_json = await redis.get(f"login:token:{token}")
-    if user_json is None:
+    cache = getattr(request.app.state, "token_cache", None)
+    user = await auth_service.load_session(redis, cache, token)
+    if user is None:
         raise HTTPException(status_code=401, detail="未登录或令牌无效")
+    return user
+
+
+async def get_tenant(
+    request: Request,
+    redis: Annotated[Redis, Depends(get_redis)],
+    token: Annotated[str | None, Security(api_key_header)],
+) -> str:
+    """限流公平排队用的租户标识：登录用户 > 已登记的 X-API-Key > 客户端 IP。
+
+    与 get_current_user_from_token 不同，这里不要求登录，令牌无效时退化为后两种。
+    只认 tenant_api_keys 里登记过的 key，否则每次换一个随机 key 就能绕过公平排队。
+    """
+    if token and (token := _strip_bearer(token)):
+        cache = getattr(request.app.state, "token_cache", None)
+        user = await auth_service.load_session(redis, cache, token)
+        # 会话里缺少 id/username 时不能归到同一个 "user:None" 桶，退化为后两种
+        user_key = (user.get("id") or user.get("username")) if user is not None else None
+        if user_key:
+            return f"user:{user_key}"
+
+    api_key = request.headers.get("X-API-Key")
+    if api_key:
+        tenant = get_settings().tenant_api_keys.get(api_key)
+        if tenant is not None:
+            return f"key:{tenant}"
 
-    try:
-        return json.loads(user_json)
-    except json.JSONDecodeError as exc:
-        raise HTTPException(status_code=401, detail="未登录或令牌无效") from exc
+    return f"ip:{getattr(request.client, 'host', 'unknown')}"
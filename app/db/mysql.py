@@ -5,6 +5,9 @@ from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engin
 from sqlalchemy.orm import sessionmaker
 
 from app.core.config import get_settings
+from app.core.sql_profiler import SqlProfiler
+from app.core.timing import TimedQueuePool, instrument_engine
+from app.models.user import EXT_INDEXED_KEYS, ext_column_expression, ext_column_name
 
 
 def _mysql_dsn() -> str:
@@ -16,15 +19,20 @@ def _mysql_dsn() -> str:
     )
 
 
-def create_mysql_engine() -> AsyncEngine:
+def create_mysql_engine(profiler: SqlProfiler | None = None) -> AsyncEngine:
     settings = get_settings()
-    return create_async_engine(
+    engine = create_async_engine(
         _mysql_dsn(),
         echo=settings.mysql_echo,
         pool_size=5,
         max_overflow=5,
         pool_recycle=1800,
+        poolclass=TimedQueuePool,
     )
+    instrument_engine(engine)
+    if profiler is not None:
+        profiler.attach(engine)
+    return engine
 
 
 def create_session_factory(engine: AsyncEngine) -> sessionmaker[AsyncSession]:
@@ -40,3 +48,50 @@ async def close_mysql_engine(engine: AsyncEngine | None) -> None:
 async def mysql_ping(session: AsyncSession) -> list[dict[str, Any]]:
     result = await session.execute(text("SELECT 1 AS ok"))
     return [dict(row) for row in result.mappings().all()]
+
+
+# 用户搜索依赖的索引名 -> 建索引 DDL
+USER_SEARCH_INDEXES = {
+    "ix_t_user_username": "ALTER TABLE t_user ADD INDEX ix_t_user_username (username)",
+    "ft_t_user_username": (
+        "ALTER TABLE t_user ADD FULLTEXT INDEX ft_t_user_username (username) WITH PARSER ngram"
+    ),
+}
+
+
+async def ensure_user_schema(engine: AsyncEngine) -> list[str]:
+    """补建 ext_json 虚拟生成列及用户搜索索引，返回新建的列名/索引名。"""
+    created: list[str] = []
+    async with engine.begin() as conn:
+        result = await conn.execute(
+            text(
+                "SELECT COLUMN_NAME FROM information_schema.COLUMNS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 't_user'"
+            )
+        )
+        existing = {row[0] for row in result}
+        for key, length in EXT_INDEXED_KEYS.items():
+            column = ext_column_name(key)
+            if column in existing:
+                continue
+            await conn.execute(
+                text(
+                    f"ALTER TABLE t_user ADD COLUMN {column} VARCHAR({length}) "
+                    f"AS ({ext_column_expression(key)}) VIRTUAL, "
+                    f"ADD INDEX ix_t_user_{column} ({column})"
+                )
+            )
+            created.append(column)
+
+        result = await conn.execute(
+            text(
+                "SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 't_user'"
+            )
+        )
+        existing_indexes = {row[0] for row in result}
+        for name, ddl in USER_SEARCH_INDEXES.items():
+            if name not in existing_indexes:
+                await conn.execute(text(ddl))
+                created.append(name)
+    return created
@@ -1,12 +1,12 @@
 from redis.asyncio import Redis
-from redis.asyncio import from_url
 
 from app.core.config import get_settings
+from app.core.timing import TimedRedis
 
 
 async def create_redis() -> Redis:
     settings = get_settings()
-    return from_url(
+    return TimedRedis.from_url(
         settings.redis_url,
         password=settings.redis_password,
         decode_responses=True,
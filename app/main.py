@@ -1,19 +1,30 @@
 import asyncio
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 import sys
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from loguru import logger
 
 from app.api.router import api_router
 from app.core.config import get_settings
-from app.core.concurrency import limited
+from app.core.broadcast import Broadcaster
+from app.core.concurrency import AdaptiveLimiter, LimiterRejected
+from app.core.heartbeat import Heartbeat
+from app.core.metrics import MetricsMiddleware
+from app.core.progress import ProgressBus, RedisProgressBus
+from app.core.resumable import StreamRegistry
+from app.core.sql_profiler import QueryBudgetMiddleware, SqlProfiler
+from app.core.timing import ServerTimingMiddleware
 from app.db.mysql import (
     close_mysql_engine,
     create_mysql_engine,
     create_session_factory,
+    ensure_user_schema,
 )
 from app.db.redis import close_redis, create_redis
+from app.core.cache import TTLCache
+from app.services.auth_service import listen_invalidations
 
 
 logger.remove()
@@ -27,24 +38,108 @@ logger.add(
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     app.state.redis = await create_redis()
-    app.state.mysql_engine = create_mysql_engine()
+    app.state.token_cache = TTLCache(
+        maxsize=settings.token_cache_size, ttl=settings.token_cache_ttl
+    )
+    token_listener = asyncio.create_task(
+        listen_invalidations(app.state.redis, app.state.token_cache)
+    )
+    app.state.heartbeat = Heartbeat(settings.sse_heartbeat_interval)
+    if settings.progress_backend == "redis":
+        app.state.progress_bus = RedisProgressBus(
+            app.state.redis,
+            maxlen=settings.progress_stream_maxlen,
+            ttl=settings.progress_stream_ttl,
+            heartbeat=app.state.heartbeat,
+        )
+    else:
+        app.state.progress_bus = ProgressBus(
+            trace_buffer_bytes=settings.progress_buffer_trace_bytes,
+            total_buffer_bytes=settings.progress_buffer_total_bytes,
+            buffer_ttl=settings.progress_buffer_ttl,
+            heartbeat=app.state.heartbeat,
+        )
+    app.state.sql_profiler = (
+        SqlProfiler(slow_query_ms=settings.mysql_slow_query_ms)
+        if settings.mysql_profile
+        else None
+    )
+    app.state.mysql_engine = create_mysql_engine(app.state.sql_profiler)
     app.state.mysql_session_factory = create_session_factory(app.state.mysql_engine)
-    app.state.llm_sem = asyncio.Semaphore(2)
-    app.state.http_sem = asyncio.Semaphore(32)
-    app.state.mysql_sem = asyncio.Semaphore(16)
-    app.state.redis_sem = asyncio.Semaphore(64)
+    if settings.mysql_auto_migrate:
+        created = await ensure_user_schema(app.state.mysql_engine)
+        if created:
+            logger.info(f"已补建 t_user 列/索引: {created}")
+    # 初始并发与原固定信号量一致，之后按观测到的持有时间自适应调整
+    # 面向外部调用方的两个限流器按租户公平排队，避免单个租户占满名额
+    app.state.llm_sem = AdaptiveLimiter(
+        "llm",
+        initial=2,
+        max_limit=4,
+        latency_target=30.0,
+        max_queue=8,
+        max_wait=10.0,
+        weights=settings.tenant_weights,
+        tenant_max_inflight=settings.llm_tenant_max_inflight,
+    )
+    app.state.llm_broadcast = Broadcaster()
+    app.state.agent_streams = StreamRegistry(
+        grace=settings.agent_stream_grace,
+        max_buffer_bytes=settings.agent_stream_buffer_bytes,
+        heartbeat=app.state.heartbeat,
+    )
+    app.state.http_sem = AdaptiveLimiter(
+        "http",
+        initial=32,
+        max_limit=64,
+        latency_target=30.0,
+        max_queue=128,
+        max_wait=5.0,
+        weights=settings.tenant_weights,
+    )
+    app.state.mysql_sem = AdaptiveLimiter(
+        "mysql", initial=16, max_limit=32, latency_target=0.5, max_queue=64, max_wait=2.0
+    )
+    app.state.redis_sem = AdaptiveLimiter(
+        "redis", initial=64, max_limit=128, latency_target=0.05, max_queue=256, max_wait=1.0
+    )
     try:
         yield
     finally:
+        token_listener.cancel()
+        with suppress(asyncio.CancelledError):
+            await token_listener
+        await app.state.progress_bus.close()
+        await app.state.agent_streams.close()
+        await app.state.llm_broadcast.close()
+        await app.state.heartbeat.close()
         await close_redis(app.state.redis)
         await close_mysql_engine(app.state.mysql_engine)
 
 
 settings = get_settings()
 app = FastAPI(title=settings.app_name, lifespan=lifespan)
+app.add_middleware(ServerTimingMiddleware, slow_request_ms=settings.slow_request_ms)
+app.add_middleware(MetricsMiddleware)
+if settings.mysql_profile and settings.mysql_query_budget is not None:
+    app.add_middleware(
+        QueryBudgetMiddleware,
+        limit=settings.mysql_query_budget,
+        mode=settings.mysql_query_budget_mode,
+    )
 app.include_router(api_router)
 
 
+@app.exception_handler(LimiterRejected)
+async def limiter_rejected_handler(request: Request, exc: LimiterRejected):
+    logger.warning(f"{request.url.path} rejected by limiter {exc}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "服务繁忙，请稍后重试", "limiter": exc.name, "reason": exc.reason},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -1,12 +1,50 @@
-from sqlalchemy import BigInteger, Integer, String, Text, text
+from sqlalchemy import BigInteger, Computed, Index, Integer, String, Text, text
 from sqlalchemy.dialects.mysql import DATETIME
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.models.base import Base
 
 
+# 允许在 /users/raw 中用 ext.<key>=value 过滤的 ext_json key 及其最大长度。
+# 每个 key 对应一个带二级索引的虚拟生成列 ext_<key>，过滤走索引而不是全表扫描。
+EXT_INDEXED_KEYS: dict[str, int] = {
+    "city": 64,
+    "source": 32,
+}
+
+
+def ext_column_name(key: str) -> str:
+    return f"ext_{key}"
+
+
+def ext_column_expression(key: str) -> str:
+    length = EXT_INDEXED_KEYS[key]
+    return f"LEFT(JSON_UNQUOTE(JSON_EXTRACT(ext_json, '$.{key}')), {length})"
+
+
+def _ext_column(key: str) -> Mapped[str | None]:
+    return mapped_column(
+        String(EXT_INDEXED_KEYS[key]),
+        Computed(ext_column_expression(key), persisted=False),
+        nullable=True,
+        index=True,
+        deferred=True,
+    )
+
+
 class User(Base):
     __tablename__ = "t_user"
+    __table_args__ = (
+        # match=prefix 走 B-Tree 前缀匹配
+        Index("ix_t_user_username", "username"),
+        # match=fulltext 走 ngram 全文索引，支持中文子串
+        Index(
+            "ft_t_user_username",
+            "username",
+            mysql_prefix="FULLTEXT",
+            mysql_with_parser="ngram",
+        ),
+    )
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
     username: Mapped[str | None] = mapped_column(String(50), nullable=True)
@@ -18,3 +56,8 @@ class User(Base):
         nullable=False,
         server_default=text("CURRENT_TIMESTAMP(3)"),
     )
+
+
+# 生成列由 EXT_INDEXED_KEYS 生成，新增可过滤的 key 只需改上面一处
+for _key in EXT_INDEXED_KEYS:
+    setattr(User, ext_column_name(_key), _ext_column(_key))
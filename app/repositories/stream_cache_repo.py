@@ -0,0 +1,20 @@
+import hashlib
+
+from redis.asyncio import Redis
+
+
+def _stream_key(request_key: str) -> str:
+    digest = hashlib.sha256(request_key.encode()).hexdigest()[:32]
+    return f"llm:stream:{digest}"
+
+
+async def get_cached_stream(redis: Redis, request_key: str) -> str | None:
+    return await redis.get(_stream_key(request_key))
+
+
+async def set_cached_stream(redis: Redis, request_key: str, payload: str, ttl: int) -> None:
+    await redis.set(_stream_key(request_key), payload, ex=ttl)
+
+
+async def delete_cached_stream(redis: Redis, request_key: str) -> None:
+    await redis.delete(_stream_key(request_key))
@@ -0,0 +1,76 @@
+from redis.asyncio import Redis
+
+
+COUNT_GEN_KEY = "user:count:gen"
+
+
+def _count_key(fingerprint: str) -> str:
+    return f"user:count:{fingerprint}"
+
+
+async def get_cached_count(redis: Redis, fingerprint: str) -> tuple[int | None, str]:
+    """返回 (缓存的 total, 当前代号)；代号变化即视为失效，一次 MGET 搞定。"""
+    gen, cached = await redis.mget(COUNT_GEN_KEY, _count_key(fingerprint))
+    gen = gen or "0"
+    if cached is None:
+        return None, gen
+    cached_gen, _, total = cached.partition(":")
+    if cached_gen != gen:
+        return None, gen
+    return int(total), gen
+
+
+async def set_cached_count(
+    redis: Redis, fingerprint: str, gen: str, total: int, ttl: int
+) -> None:
+    await redis.set(_count_key(fingerprint), f"{gen}:{total}", ex=ttl)
+
+
+async def invalidate_counts(redis: Redis) -> None:
+    # 过滤条件组合无法穷举，直接推进代号让所有 count 缓存一起失效
+    await redis.incr(COUNT_GEN_KEY)
+
+
+# 缓存中表示“该 id 不存在”的占位值
+USER_MISSING = "-"
+
+# 只删除自己持有的锁，避免锁过期后误删别人的
+_RELEASE_LOCK_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def _user_key(user_id: int) -> str:
+    return f"user:obj:{user_id}"
+
+
+def _user_lock_key(user_id: int) -> str:
+    return f"user:obj:{user_id}:lock"
+
+
+async def get_cached_user(redis: Redis, user_id: int) -> str | None:
+    return await redis.get(_user_key(user_id))
+
+
+async def set_cached_user(redis: Redis, user_id: int, payload: str, ttl: int) -> None:
+    await redis.set(_user_key(user_id), payload, ex=ttl)
+
+
+async def acquire_user_lock(redis: Redis, user_id: int, token: str, ttl_ms: int) -> bool:
+    return bool(await redis.set(_user_lock_key(user_id), token, nx=True, px=ttl_ms))
+
+
+async def release_user_lock(redis: Redis, user_id: int, token: str) -> None:
+    await redis.eval(_RELEASE_LOCK_LUA, 1, _user_lock_key(user_id), token)
+
+
+async def invalidate_user(redis: Redis, user_id: int) -> None:
+    await redis.delete(_user_key(user_id))
+
+
+async def invalidate_users(redis: Redis, user_ids: list[int]) -> None:
+    if user_ids:
+        await redis.delete(*(_user_key(user_id) for user_id in user_ids))
@@ -1,31 +1,77 @@
-from sqlalchemy import func, select, text
+from collections.abc import AsyncIterator, Sequence
+import hashlib
+import json
+
+from sqlalchemy import insert, select, text
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models.user import User
+from app.models.user import User, ext_column_name
+from app.schemas import EXPORT_FIELDS, USER_FIELDS
+
+
+def _select_columns(columns: Sequence[str]) -> list[str]:
+    # id 始终要查，游标分页依赖它；调用方传入的列名已按 USER_FIELDS 校验
+    return ["id", *(c for c in columns if c != "id")]
+
+
+# 与 MySQL 的 ngram_token_size 保持一致，比它短的关键字无法走全文索引
+NGRAM_TOKEN_SIZE = 2
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
 
 
 def _build_filters(
     username: str | None,
     age_min: int | None,
     age_max: int | None,
+    ext: dict[str, str] | None = None,
+    match: str = "contains",
 ):
     filters: list[str] = []
     params: dict[str, object] = {}
 
     if username:
-        filters.append("username LIKE :username")
-        params["username"] = f"%{username}%"
+        if match == "prefix":
+            # 前缀匹配可以用上 username 上的 B-Tree 索引
+            filters.append("username LIKE :username")
+            params["username"] = f"{_escape_like(username)}%"
+        elif match == "fulltext" and len(username) >= NGRAM_TOKEN_SIZE:
+            # 以短语形式检索 ngram 全文索引，效果接近子串匹配
+            filters.append("MATCH(username) AGAINST(:username IN BOOLEAN MODE)")
+            params["username"] = '"' + username.replace('"', " ") + '"'
+        else:
+            filters.append("username LIKE :username")
+            params["username"] = f"%{username}%"
     if age_min is not None:
         filters.append("age >= :age_min")
         params["age_min"] = age_min
     if age_max is not None:
         filters.append("age <= :age_max")
         params["age_max"] = age_max
+    # key 已在路由层按 EXT_INDEXED_KEYS 校验，列名可以安全拼接
+    for key, value in sorted((ext or {}).items()):
+        filters.append(f"{ext_column_name(key)} = :ext_{key}")
+        params[f"ext_{key}"] = value
 
     where_clause = f" WHERE {' AND '.join(filters)}" if filters else ""
     return where_clause, params
 
 
+def filter_fingerprint(
+    username: str | None,
+    age_min: int | None,
+    age_max: int | None,
+    ext: dict[str, str] | None = None,
+    match: str = "contains",
+) -> str:
+    """归一化后的过滤条件指纹，用于游标校验。"""
+    _, params = _build_filters(username, age_min, age_max, ext, match)
+    raw = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+
 async def create_user(session: AsyncSession, user: User) -> User:
     session.add(user)
     await session.commit()
@@ -33,20 +79,101 @@ async def create_user(session: AsyncSession, user: User) -> User:
     return user
 
 
+async def insert_users(session: AsyncSession, rows: list[dict]) -> list[int]:
+    """写入一批用户并提交，返回按输入顺序的自增 id。
+
+    innodb_autoinc_lock_mode 为 0/1 时，已知行数的多值 INSERT 一次分到按步长连续的自增值，
+    用一条 INSERT 写入后由 LAST_INSERT_ID() 推算；交错模式（2）不保证连续，
+    改为同一事务内逐行写入，直接取每行的主键。
+    """
+    step, lock_mode = (
+        await session.execute(
+            text("SELECT @@auto_increment_increment, @@innodb_autoinc_lock_mode")
+        )
+    ).one()
+    if int(lock_mode) in (0, 1):
+        result = await session.execute(insert(User).values(rows))
+        # LAST_INSERT_ID() 返回的是这批中第一行的 id
+        first_id = int(result.lastrowid)
+        ids = [first_id + offset * int(step) for offset in range(len(rows))]
+    else:
+        ids = [await insert_user_row(session, row) for row in rows]
+    await session.commit()
+    return ids
+
+
+async def insert_user_row(session: AsyncSession, row: dict) -> int:
+    """在调用方的事务/保存点内写入单行，不提交。"""
+    result = await session.execute(insert(User).values(row))
+    return int(result.inserted_primary_key[0])
+
+
+async def get_users_by_ids(session: AsyncSession, user_ids: list[int]) -> list[User]:
+    result = await session.execute(select(User).where(User.id.in_(user_ids)))
+    return result.scalars().all()
+
+
 async def get_user_by_id(session: AsyncSession, user_id: int) -> User | None:
     result = await session.execute(select(User).where(User.id == user_id))
     return result.scalar_one_or_none()
 
 
-async def list_users(session: AsyncSession, page: int, size: int) -> tuple[int, list[User]]:
-    total = await session.scalar(select(func.count()).select_from(User))
+async def count_users(
+    session: AsyncSession,
+    username: str | None,
+    age_min: int | None,
+    age_max: int | None,
+    ext: dict[str, str] | None = None,
+    match: str = "contains",
+) -> int:
+    where_clause, params = _build_filters(username, age_min, age_max, ext, match)
+    total_sql = text(f"SELECT COUNT(1) AS total FROM t_user{where_clause}")
+    total = await session.scalar(total_sql, params)
+    return int(total or 0)
+
+
+async def estimate_users(
+    session: AsyncSession,
+    username: str | None,
+    age_min: int | None,
+    age_max: int | None,
+    ext: dict[str, str] | None = None,
+    match: str = "contains",
+) -> int:
+    """近似行数：无过滤时读 InnoDB 表统计，有过滤时取优化器的 EXPLAIN 估算。"""
+    where_clause, params = _build_filters(username, age_min, age_max, ext, match)
+    if not where_clause:
+        total = await session.scalar(
+            text(
+                "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 't_user'"
+            )
+        )
+        return int(total or 0)
+
     result = await session.execute(
-        select(User)
-        .order_by(User.id.desc())
-        .offset((page - 1) * size)
-        .limit(size)
+        text(f"EXPLAIN SELECT 1 FROM t_user{where_clause}"), params
     )
-    return int(total or 0), result.scalars().all()
+    row = result.mappings().first()
+    return int(row["rows"] or 0) if row else 0
+
+
+async def list_users(
+    session: AsyncSession,
+    page: int,
+    size: int,
+    cursor_id: int | None = None,
+    columns: Sequence[str] = USER_FIELDS,
+) -> list[dict]:
+    selected = [getattr(User, c) for c in _select_columns(columns)]
+    stmt = select(*selected).order_by(User.id.desc()).limit(size)
+    if cursor_id is not None:
+        # keyset 分页：直接从主键定位，不再扫描丢弃前面的行
+        stmt = stmt.where(User.id < cursor_id)
+    else:
+        stmt = stmt.offset((page - 1) * size)
+    result = await session.execute(stmt)
+    return [dict(row) for row in result.mappings().all()]
 
 
 async def list_users_raw(
@@ -56,23 +183,57 @@ async def list_users_raw(
     username: str | None,
     age_min: int | None,
     age_max: int | None,
-) -> tuple[int, list[dict]]:
-    where_clause, params = _build_filters(username, age_min, age_max)
+    cursor_id: int | None = None,
+    columns: Sequence[str] = USER_FIELDS,
+    ext: dict[str, str] | None = None,
+    match: str = "contains",
+) -> list[dict]:
+    where_clause, params = _build_filters(username, age_min, age_max, ext, match)
+    select_list = ", ".join(_select_columns(columns))
 
-    total_sql = text(f"SELECT COUNT(1) AS total FROM t_user{where_clause}")
-    total = await session.scalar(total_sql, params)
-
-    data_sql = text(
-        "SELECT id, username, password, age, ext_json, create_time "
-        f"FROM t_user{where_clause} ORDER BY id DESC LIMIT :limit OFFSET :offset"
-    )
     params_with_page = dict(params)
     params_with_page["limit"] = size
-    params_with_page["offset"] = (page - 1) * size
+    if cursor_id is not None:
+        keyset = " AND id < :cursor_id" if where_clause else " WHERE id < :cursor_id"
+        data_sql = text(
+            f"SELECT {select_list} "
+            f"FROM t_user{where_clause}{keyset} ORDER BY id DESC LIMIT :limit"
+        )
+        params_with_page["cursor_id"] = cursor_id
+    else:
+        data_sql = text(
+            f"SELECT {select_list} "
+            f"FROM t_user{where_clause} ORDER BY id DESC LIMIT :limit OFFSET :offset"
+        )
+        params_with_page["offset"] = (page - 1) * size
 
     result = await session.execute(data_sql, params_with_page)
     rows = result.mappings().all()
-    return int(total or 0), [dict(row) for row in rows]
+    return [dict(row) for row in rows]
+
+
+async def stream_users_raw(
+    session: AsyncSession,
+    username: str | None,
+    age_min: int | None,
+    age_max: int | None,
+    ext: dict[str, str] | None = None,
+    match: str = "contains",
+    batch_size: int = 1000,
+) -> AsyncIterator[list[dict]]:
+    """服务端游标逐批读取导出字段（不含密码），内存只保留当前这一批。"""
+    where_clause, params = _build_filters(username, age_min, age_max, ext, match)
+    data_sql = text(
+        f"SELECT {', '.join(EXPORT_FIELDS)} "
+        f"FROM t_user{where_clause} ORDER BY id DESC"
+    ).execution_options(yield_per=batch_size)
+
+    result = await session.stream(data_sql, params)
+    try:
+        async for partition in result.mappings().partitions():
+            yield [dict(row) for row in partition]
+    finally:
+        await result.close()
 
 
 async def update_user(session: AsyncSession, user: User) -> User:
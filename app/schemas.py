@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Annotated, Literal, Union
 
-from pydantic import BaseModel, Field, ConfigDict
+from pydantic import BaseModel, Field, ConfigDict, model_serializer
 
 
 class ClarifyResponse(BaseModel):
@@ -50,8 +50,76 @@ class UserOut(UserBase):
     create_time: datetime
 
 
+# ?fields= 可选的字段名
+USER_FIELDS = ("id", "username", "password", "age", "ext_json", "create_time")
+
+# 导出的字段：不含密码
+EXPORT_FIELDS = tuple(field for field in USER_FIELDS if field != "password")
+
+
+class UserPartial(BaseModel):
+    """按 ?fields= 投影后的用户，只输出被选中的字段。"""
+
+    id: int | None = None
+    username: str | None = None
+    password: str | None = None
+    age: int | None = None
+    ext_json: dict | None = None
+    create_time: datetime | None = None
+
+    @model_serializer(mode="wrap")
+    def _only_selected(self, handler):
+        data = handler(self)
+        return {key: value for key, value in data.items() if key in self.model_fields_set}
+
+
+TotalMode = Literal["exact", "cached", "estimate"]
+UsernameMatch = Literal["prefix", "contains", "fulltext"]
+
+
 class UserPage(BaseModel):
     total: int
+    total_mode: TotalMode = "exact"
     page: int
     size: int
     items: list[UserOut]
+    next_cursor: str | None = None
+
+
+class UserPartialPage(BaseModel):
+    total: int
+    total_mode: TotalMode = "exact"
+    page: int
+    size: int
+    items: list[UserPartial]
+    next_cursor: str | None = None
+
+
+class UserBatchItem(BaseModel):
+    index: int
+    ok: bool
+    user: UserOut | None = None
+    error: str | None = None
+
+
+class UserBatchResult(BaseModel):
+    inserted: int
+    failed: int
+    items: list[UserBatchItem]
+
+
+class UserLookup(BaseModel):
+    ids: list[int] = Field(min_length=1, max_length=1000)
+
+
+class UserImportError(BaseModel):
+    line: int
+    error: str
+
+
+class UserImportResult(BaseModel):
+    inserted: int = 0
+    failed: int = 0
+    skipped: int = 0
+    aborted: bool = False
+    errors: list[UserImportError] = Field(default_factory=list)
@@ -1,8 +1,17 @@
-from typing import AsyncGenerator
+from typing import AsyncGenerator, AsyncIterator, Literal
 import asyncio
+import json
 import textwrap
+import time
 
-from app.core.concurrency import limited
+from loguru import logger
+from redis.asyncio import Redis
+
+from app.core.concurrency import AdaptiveLimiter, limited
+from app.repositories import stream_cache_repo
+
+
+ReplayMode = Literal["paced", "instant"]
 
 
 async def attention_chat() -> AsyncGenerator[str, None]:
@@ -39,13 +48,91 @@ async def attention_chat() -> AsyncGenerator[str, None]:
         print("generator cleaned")
 
 
-async def llm_stream(sem: asyncio.Semaphore) -> AsyncGenerator[str, None]:
-    async with limited(sem):
+async def llm_stream(
+    sem: asyncio.Semaphore | AdaptiveLimiter, tenant: str | None = None
+) -> AsyncGenerator[str, None]:
+    async with limited(sem, tenant):
         async for chunk in attention_chat():
             yield chunk
 
 
-async def echo_http(sem: asyncio.Semaphore) -> AsyncGenerator[str, None]:
-    async with limited(sem):
+async def echo_http(
+    sem: asyncio.Semaphore | AdaptiveLimiter, tenant: str | None = None
+) -> AsyncGenerator[str, None]:
+    async with limited(sem, tenant):
         async for chunk in attention_chat():
             yield chunk
+
+
+async def record_stream(
+    redis: Redis,
+    request_key: str,
+    source: AsyncIterator[str],
+    *,
+    ttl: int,
+    max_bytes: int,
+) -> AsyncGenerator[str, None]:
+    """透传上游 chunk，同时记录 [距上一个 chunk 的毫秒数, chunk]；完整结束才写缓存。
+
+    首个 chunk 记 0：之前的耗时是排队等 llm_sem 和上游建连，回放时不应重现。
+    中途取消、出错或超过 max_bytes 的结果都不缓存。
+    """
+    entries: list[list] | None = []
+    size = 0
+    last: float | None = None
+    complete = False
+    try:
+        async for chunk in source:
+            now = time.monotonic()
+            if last is None:
+                last = now
+            if entries is not None:
+                entries.append([round((now - last) * 1000), chunk])
+                size += len(chunk.encode()) + 8
+                if size > max_bytes:
+                    entries = None
+            last = now
+            yield chunk
+        complete = True
+    finally:
+        if complete and entries:
+            payload = json.dumps(entries, ensure_ascii=False, separators=(",", ":"))
+            try:
+                await stream_cache_repo.set_cached_stream(redis, request_key, payload, ttl)
+            except Exception:
+                logger.exception("llm stream cache write failed")
+
+
+async def load_cached_stream(redis: Redis, request_key: str) -> list[list] | None:
+    try:
+        payload = await stream_cache_repo.get_cached_stream(redis, request_key)
+    except Exception:
+        # 缓存不可用时退回实时生成
+        logger.exception("llm stream cache read failed")
+        return None
+    if payload is None:
+        return None
+    try:
+        entries = json.loads(payload)
+        # 回放开始后响应头已发出，格式问题必须在这里发现
+        if not all(isinstance(delay, int) and isinstance(chunk, str) for delay, chunk in entries):
+            raise ValueError("unexpected cached stream entry")
+    except (ValueError, TypeError):
+        # 缓存内容损坏或被截断：删掉后退回实时生成
+        logger.warning(f"corrupt llm stream cache entry for {request_key}, dropping it")
+        try:
+            await stream_cache_repo.delete_cached_stream(redis, request_key)
+        except Exception:
+            logger.exception("llm stream cache delete failed")
+        return None
+    return entries
+
+
+async def replay_stream(
+    entries: list[list], mode: ReplayMode = "paced"
+) -> AsyncGenerator[str, None]:
+    """回放缓存的 chunk 序列，不占 llm_sem；paced 按原始间隔输出，instant 一次性输出。"""
+    for delay_ms, chunk in entries:
+        if mode == "paced" and delay_ms:
+            await asyncio.sleep(delay_ms / 1000)
+        yield chunk
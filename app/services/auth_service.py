@@ -0,0 +1,74 @@
+import asyncio
+import json
+from typing import Any
+
+from loguru import logger
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from app.core.cache import TTLCache
+
+
+TOKEN_KEY_PREFIX = "login:token:"
+# 所有 worker 订阅同一频道，登出/重新登录时广播失效的 token
+INVALIDATE_CHANNEL = "login:token:invalidate"
+
+
+def _token_key(token: str) -> str:
+    return f"{TOKEN_KEY_PREFIX}{token}"
+
+
+async def store_session(redis: Redis, token: str, user: dict[str, Any]) -> None:
+    user_json = json.dumps(user, ensure_ascii=False)
+    await redis.set(_token_key(token), user_json)
+    # 同一个 token 重新登录时，其它进程里的旧会话也要失效
+    await redis.publish(INVALIDATE_CHANNEL, token)
+
+
+async def revoke_session(redis: Redis, token: str) -> None:
+    await redis.delete(_token_key(token))
+    await redis.publish(INVALIDATE_CHANNEL, token)
+
+
+async def load_session(
+    redis: Redis, cache: TTLCache | None, token: str
+) -> dict[str, Any] | None:
+    """先查进程内 L1，未命中再回 Redis；返回 None 表示未登录或会话损坏。"""
+    if cache is not None:
+        user = cache.get(token)
+        if user is not None:
+            return user
+        generation = cache.generation
+
+    user_json = await redis.get(_token_key(token))
+    if user_json is None:
+        return None
+    try:
+        user = json.loads(user_json)
+    except json.JSONDecodeError:
+        return None
+
+    # 读 Redis 期间收到过登出/重新登录的失效通知时不写回，避免把已撤销的会话缓存一整个 TTL
+    if cache is not None and cache.generation == generation:
+        cache.set(token, user)
+    return user
+
+
+async def listen_invalidations(redis: Redis, cache: TTLCache) -> None:
+    """后台任务：订阅失效频道并从 L1 中剔除对应 token。"""
+    while True:
+        pubsub = redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(INVALIDATE_CHANNEL)
+            # 断线期间可能漏掉失效消息，重新订阅后整体清空最稳妥
+            cache.clear()
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    cache.pop(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except RedisError:
+            logger.exception("token invalidation listener disconnected, retrying")
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
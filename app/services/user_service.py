@@ -1,10 +1,39 @@
+import asyncio
+from collections.abc import AsyncIterator
+import csv
+from datetime import datetime
+import io
 import json
 import random
+import uuid
+from typing import Any
 
+from app.core import timing
+from app.core.config import get_settings
+from app.core.pagination import decode_cursor, encode_cursor
 from app.models.user import User
-from app.repositories import user_repo
-from app.schemas import UserCreate, UserOut, UserPage, UserUpdate
+from app.repositories import user_cache_repo, user_repo
+from app.schemas import (
+    EXPORT_FIELDS,
+    TotalMode,
+    USER_FIELDS,
+    UserBatchItem,
+    UserBatchResult,
+    UserCreate,
+    UserImportError,
+    UserImportResult,
+    UserOut,
+    UserPage,
+    UserPartial,
+    UserPartialPage,
+    UserUpdate,
+    UsernameMatch,
+)
+from pydantic import ValidationError
+from redis.asyncio import Redis
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
 
 
 def _serialize_ext_json(value: dict | None) -> str | None:
@@ -23,17 +52,115 @@ def _deserialize_ext_json(value: str | None) -> dict | None:
 
 
 def _to_schema(user: User) -> UserOut:
-    return UserOut(
-        id=user.id,
-        username=user.username,
-        password=user.password,
-        age=user.age,
-        ext_json=_deserialize_ext_json(user.ext_json),
-        create_time=user.create_time,
+    with timing.timed("ser"):
+        return UserOut(
+            id=user.id,
+            username=user.username,
+            password=user.password,
+            age=user.age,
+            ext_json=_deserialize_ext_json(user.ext_json),
+            create_time=user.create_time,
+        )
+
+
+def _row_to_schema(row: dict) -> UserOut:
+    # 数据库里的数据是可信的，跳过 pydantic 校验直接构造
+    return UserOut.model_construct(
+        id=row["id"],
+        username=row["username"],
+        password=row["password"],
+        age=row["age"],
+        ext_json=_deserialize_ext_json(row["ext_json"]),
+        create_time=row["create_time"],
+    )
+
+
+def _row_to_partial(row: dict, fields: tuple[str, ...]) -> UserPartial:
+    data = {field: row[field] for field in fields}
+    # 只有选中 ext_json 时才做 JSON 解码
+    if "ext_json" in data:
+        data["ext_json"] = _deserialize_ext_json(data["ext_json"])
+    return UserPartial.model_construct(**data)
+
+
+def _next_cursor(rows: list[dict], size: int, fingerprint: str) -> str | None:
+    # 不足一页说明已经到底了
+    if len(rows) < size:
+        return None
+    return encode_cursor(rows[-1]["id"], fingerprint)
+
+
+def _build_page(
+    rows: list[dict],
+    fields: tuple[str, ...] | None,
+    total: int,
+    total_mode: TotalMode,
+    page: int,
+    size: int,
+    fingerprint: str,
+) -> UserPage | UserPartialPage:
+    next_cursor = _next_cursor(rows, size, fingerprint)
+    with timing.timed("ser"):
+        if fields is None:
+            return UserPage.model_construct(
+                total=total,
+                total_mode=total_mode,
+                page=page,
+                size=size,
+                items=[_row_to_schema(row) for row in rows],
+                next_cursor=next_cursor,
+            )
+        return UserPartialPage.model_construct(
+            total=total,
+            total_mode=total_mode,
+            page=page,
+            size=size,
+            items=[_row_to_partial(row, fields) for row in rows],
+            next_cursor=next_cursor,
+        )
+
+
+async def _resolve_total(
+    session: AsyncSession,
+    redis: Redis | None,
+    total_mode: TotalMode,
+    fingerprint: str,
+    username: str | None,
+    age_min: int | None,
+    age_max: int | None,
+    ext: dict[str, str] | None = None,
+    match: UsernameMatch = "contains",
+) -> tuple[int, TotalMode]:
+    """按 total_mode 计算总数，返回 (total, 实际采用的模式)。"""
+    if total_mode == "estimate":
+        total = await user_repo.estimate_users(
+            session, username, age_min, age_max, ext, match
+        )
+        return total, "estimate"
+
+    if total_mode == "cached" and redis is not None:
+        cached, gen = await user_cache_repo.get_cached_count(redis, fingerprint)
+        if cached is not None:
+            return cached, "cached"
+        total = await user_repo.count_users(
+            session, username, age_min, age_max, ext, match
+        )
+        await user_cache_repo.set_cached_count(
+            redis, fingerprint, gen, total, get_settings().user_count_cache_ttl
+        )
+        return total, "cached"
+
+    total = await user_repo.count_users(
+        session, username, age_min, age_max, ext, match
     )
+    return total, "exact"
 
 
-async def create_user(session: AsyncSession, payload: UserCreate) -> UserOut:
+async def create_user(
+    session: AsyncSession,
+    payload: UserCreate,
+    redis: Redis | None = None,
+) -> UserOut:
     user = User(
         username=payload.username,
         password=payload.password,
@@ -41,24 +168,272 @@ async def create_user(session: AsyncSession, payload: UserCreate) -> UserOut:
         ext_json=_serialize_ext_json(payload.ext_json),
     )
     user = await user_repo.create_user(session, user)
+    if redis is not None:
+        await user_cache_repo.invalidate_counts(redis)
+        # 清掉可能残留的“不存在”占位
+        await user_cache_repo.invalidate_user(redis, user.id)
     return _to_schema(user)
 
 
-async def get_user(session: AsyncSession, user_id: int) -> UserOut | None:
+def _to_row(payload: UserCreate) -> dict[str, Any]:
+    return {
+        "username": payload.username,
+        "password": payload.password,
+        "age": payload.age,
+        "ext_json": _serialize_ext_json(payload.ext_json),
+    }
+
+
+async def _insert_rows(
+    session: AsyncSession,
+    rows: list[tuple[int, dict[str, Any]]],
+    stop_on_error: bool = False,
+) -> tuple[dict[int, int], dict[int, str]]:
+    """写入 (index, row) 列表，返回 index->id 以及 index->错误信息。
+
+    stop_on_error=True 时逐行重试遇到首个出错的行即停止，之后的行不再写入。
+    """
+    try:
+        ids = await user_repo.insert_users(session, [row for _, row in rows])
+        return {index: user_id for (index, _), user_id in zip(rows, ids)}, {}
+    except DBAPIError:
+        await session.rollback()
+
+    # 整批失败时逐行放进保存点重试，定位到具体出错的行
+    ids_by_index: dict[int, int] = {}
+    errors: dict[int, str] = {}
+    for index, row in rows:
+        try:
+            async with session.begin_nested():
+                ids_by_index[index] = await user_repo.insert_user_row(session, row)
+        except DBAPIError as exc:
+            errors[index] = str(exc.orig)
+            if stop_on_error:
+                break
+    await session.commit()
+    return ids_by_index, errors
+
+
+async def create_users_batch(
+    session: AsyncSession,
+    payloads: list[dict[str, Any]],
+    redis: Redis | None = None,
+) -> UserBatchResult:
+    errors: dict[int, str] = {}
+    rows: list[tuple[int, dict[str, Any]]] = []
+    for index, raw in enumerate(payloads):
+        try:
+            rows.append((index, _to_row(UserCreate.model_validate(raw))))
+        except ValidationError as exc:
+            errors[index] = str(exc)
+
+    ids_by_index: dict[int, int] = {}
+    if rows:
+        ids_by_index, insert_errors = await _insert_rows(session, rows)
+        errors.update(insert_errors)
+
+    users: dict[int, User] = {}
+    if ids_by_index:
+        inserted = await user_repo.get_users_by_ids(session, list(ids_by_index.values()))
+        users = {u.id: u for u in inserted}
+        if redis is not None:
+            await user_cache_repo.invalidate_counts(redis)
+            await user_cache_repo.invalidate_users(redis, list(ids_by_index.values()))
+
+    def inserted_item(index: int) -> UserBatchItem:
+        # 行已提交就算成功；回查前被并发删除时只是拿不到详情，不能报失败让客户端重试
+        user = users.get(ids_by_index[index])
+        return UserBatchItem(index=index, ok=True, user=_to_schema(user) if user else None)
+
+    items = [
+        inserted_item(index)
+        if index in ids_by_index
+        else UserBatchItem(index=index, ok=False, error=errors.get(index))
+        for index in range(len(payloads))
+    ]
+    return UserBatchResult(inserted=len(ids_by_index), failed=len(errors), items=items)
+
+
+# 导入结果里最多保留的错误明细条数
+IMPORT_MAX_ERRORS = 100
+
+
+async def _iter_lines(
+    chunks: AsyncIterator[bytes], max_line_bytes: int
+) -> AsyncIterator[tuple[int, bytes | None]]:
+    """把请求体按行切开，产出 (行号, 内容)；超长行产出 None，不会整行缓存。"""
+    buffer = b""
+    line_no = 0
+    oversized = False
+    async for chunk in chunks:
+        buffer += chunk
+        # 用起始位置扫描，每个 chunk 只在最后切一次剩余部分，避免每行都复制整个缓冲
+        start = 0
+        while True:
+            end = buffer.find(b"\n", start)
+            if end < 0:
+                break
+            line = buffer[start:end]
+            start = end + 1
+            line_no += 1
+            yield line_no, None if oversized or len(line) > max_line_bytes else line
+            oversized = False
+        buffer = buffer[start:]
+        if len(buffer) > max_line_bytes:
+            # 丢弃超长行已读到的部分，只记住它需要报错
+            buffer = b""
+            oversized = True
+    if buffer or oversized:
+        yield line_no + 1, None if oversized or len(buffer) > max_line_bytes else buffer
+
+
+async def import_users(
+    session: AsyncSession,
+    chunks: AsyncIterator[bytes],
+    chunk_size: int,
+    continue_on_error: bool,
+    redis: Redis | None = None,
+) -> UserImportResult:
+    """边读边写：攒满 chunk_size 行才写库，写库期间不再读取请求体，形成背压。
+
+    每批单独提交，continue_on_error=False 时遇到首个错误即停止，已提交的批次保留。
+    """
+    result = UserImportResult()
+    pending: list[tuple[int, dict[str, Any]]] = []
+
+    def record_error(line_no: int, error: str) -> None:
+        result.failed += 1
+        if len(result.errors) < IMPORT_MAX_ERRORS:
+            result.errors.append(UserImportError(line=line_no, error=error))
+
+    async def flush() -> None:
+        ids_by_line, errors = await _insert_rows(
+            session, pending, stop_on_error=not continue_on_error
+        )
+        result.inserted += len(ids_by_line)
+        if ids_by_line and redis is not None:
+            # 导入前查过这些 id 的请求可能留下了“不存在”的占位缓存
+            await user_cache_repo.invalidate_users(redis, list(ids_by_line.values()))
+        for line_no, error in errors.items():
+            record_error(line_no, error)
+        pending.clear()
+
+    max_line_bytes = get_settings().user_import_max_line_bytes
+    async for line_no, line in _iter_lines(chunks, max_line_bytes):
+        if line is None:
+            record_error(line_no, f"line exceeds {max_line_bytes} bytes")
+        elif not line.strip():
+            result.skipped += 1
+            continue
+        else:
+            try:
+                pending.append((line_no, _to_row(UserCreate.model_validate_json(line))))
+            except ValidationError as exc:
+                record_error(line_no, str(exc))
+
+        if result.failed and not continue_on_error:
+            result.aborted = True
+            break
+        if len(pending) >= chunk_size:
+            await flush()
+            if result.failed and not continue_on_error:
+                result.aborted = True
+                break
+
+    if pending:
+        await flush()
+        result.aborted = result.aborted or bool(result.failed and not continue_on_error)
+
+    if result.inserted and redis is not None:
+        await user_cache_repo.invalidate_counts(redis)
+    return result
+
+
+async def get_users(session: AsyncSession, user_ids: list[int]) -> list[UserOut]:
+    """一次 IN 查询批量取用户，按请求顺序返回，不存在的 id 直接跳过。"""
+    unique_ids = list(dict.fromkeys(user_ids))
+    users = {u.id: u for u in await user_repo.get_users_by_ids(session, unique_ids)}
+    return [_to_schema(users[user_id]) for user_id in unique_ids if user_id in users]
+
+
+async def _load_user(session: AsyncSession, user_id: int) -> UserOut | None:
     user = await user_repo.get_user_by_id(session, user_id)
     if user is None:
         return None
     return _to_schema(user)
 
 
-async def list_users(session: AsyncSession, page: int, size: int) -> UserPage:
-    total, users = await user_repo.list_users(session, page, size)
-    return UserPage(
-        total=total,
-        page=page,
-        size=size,
-        items=[_to_schema(u) for u in users],
+def _from_cache(raw: str) -> UserOut | None:
+    if raw == user_cache_repo.USER_MISSING:
+        return None
+    return UserOut.model_validate_json(raw)
+
+
+async def _fill_user_cache(
+    session: AsyncSession, redis: Redis, user_id: int
+) -> UserOut | None:
+    settings = get_settings()
+    user = await _load_user(session, user_id)
+    if user is None:
+        await user_cache_repo.set_cached_user(
+            redis, user_id, user_cache_repo.USER_MISSING, settings.user_cache_negative_ttl
+        )
+        return None
+
+    ttl = settings.user_cache_ttl + random.randint(0, settings.user_cache_ttl_jitter)
+    await user_cache_repo.set_cached_user(redis, user_id, user.model_dump_json(), ttl)
+    return user
+
+
+async def get_user(
+    session: AsyncSession,
+    user_id: int,
+    redis: Redis | None = None,
+) -> UserOut | None:
+    if redis is None:
+        return await _load_user(session, user_id)
+
+    raw = await user_cache_repo.get_cached_user(redis, user_id)
+    if raw is not None:
+        return _from_cache(raw)
+
+    # 缓存未命中：只让拿到锁的请求回源，其余请求短暂等待它回填，防止击穿
+    token = uuid.uuid4().hex
+    if await user_cache_repo.acquire_user_lock(redis, user_id, token, ttl_ms=3000):
+        try:
+            return await _fill_user_cache(session, redis, user_id)
+        finally:
+            await user_cache_repo.release_user_lock(redis, user_id, token)
+
+    for _ in range(10):
+        await asyncio.sleep(0.05)
+        raw = await user_cache_repo.get_cached_user(redis, user_id)
+        if raw is not None:
+            return _from_cache(raw)
+
+    # 持锁方太慢（或已失败），直接查库但不回填，交给下一次持锁者
+    return await _load_user(session, user_id)
+
+
+async def list_users(
+    session: AsyncSession,
+    page: int,
+    size: int,
+    cursor: str | None = None,
+    *,
+    redis: Redis | None = None,
+    total_mode: TotalMode = "exact",
+    fields: tuple[str, ...] | None = None,
+) -> UserPage | UserPartialPage:
+    fingerprint = user_repo.filter_fingerprint(None, None, None)
+    cursor_id = decode_cursor(cursor, fingerprint) if cursor else None
+    total, used_mode = await _resolve_total(
+        session, redis, total_mode, fingerprint, None, None, None
     )
+    rows = await user_repo.list_users(
+        session, page, size, cursor_id, fields or USER_FIELDS
+    )
+    return _build_page(rows, fields, total, used_mode, page, size, fingerprint)
 
 
 async def list_users_raw(
@@ -68,28 +443,99 @@ async def list_users_raw(
     username: str | None,
     age_min: int | None,
     age_max: int | None,
-) -> UserPage:
-    total, rows = await user_repo.list_users_raw(
-        session, page, size, username, age_min, age_max
+    cursor: str | None = None,
+    *,
+    redis: Redis | None = None,
+    total_mode: TotalMode = "exact",
+    fields: tuple[str, ...] | None = None,
+    ext: dict[str, str] | None = None,
+    match: UsernameMatch = "contains",
+) -> UserPage | UserPartialPage:
+    fingerprint = user_repo.filter_fingerprint(username, age_min, age_max, ext, match)
+    cursor_id = decode_cursor(cursor, fingerprint) if cursor else None
+    total, used_mode = await _resolve_total(
+        session,
+        redis,
+        total_mode,
+        fingerprint,
+        username,
+        age_min,
+        age_max,
+        ext,
+        match,
     )
-    items = [
-        UserOut(
-            id=row["id"],
-            username=row["username"],
-            password=row["password"],
-            age=row["age"],
-            ext_json=_deserialize_ext_json(row["ext_json"]),
-            create_time=row["create_time"],
+    rows = await user_repo.list_users_raw(
+        session,
+        page,
+        size,
+        username,
+        age_min,
+        age_max,
+        cursor_id,
+        fields or USER_FIELDS,
+        ext,
+        match,
+    )
+    return _build_page(rows, fields, total, used_mode, page, size, fingerprint)
+
+
+def _format_time(value: object) -> object:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _export_ndjson(rows: list[dict]) -> str:
+    lines = []
+    for row in rows:
+        item = dict(row)
+        item["ext_json"] = _deserialize_ext_json(row["ext_json"])
+        item["create_time"] = _format_time(row["create_time"])
+        lines.append(json.dumps(item, ensure_ascii=False))
+    return "\n".join(lines) + "\n"
+
+
+def _export_csv(rows: list[dict]) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        # ext_json 保持原始 JSON 文本，不做解析
+        writer.writerow(
+            [
+                row["id"],
+                row["username"],
+                row["age"],
+                row["ext_json"],
+                _format_time(row["create_time"]),
+            ]
         )
-        for row in rows
-    ]
-    return UserPage(total=total, page=page, size=size, items=items)
+    return buffer.getvalue()
+
+
+async def export_users(
+    session_factory: sessionmaker[AsyncSession],
+    fmt: str,
+    username: str | None,
+    age_min: int | None,
+    age_max: int | None,
+    ext: dict[str, str] | None = None,
+    match: UsernameMatch = "contains",
+) -> AsyncIterator[str]:
+    """按批产出导出内容；自己管理 session，生命周期跟随响应流而非请求依赖。"""
+    encode = _export_csv if fmt == "csv" else _export_ndjson
+    if fmt == "csv":
+        yield ",".join(EXPORT_FIELDS) + "\r\n"
+
+    async with session_factory() as session:
+        async for rows in user_repo.stream_users_raw(
+            session, username, age_min, age_max, ext, match
+        ):
+            yield encode(rows)
 
 
 async def update_user(
     session: AsyncSession,
     user_id: int,
     payload: UserUpdate,
+    redis: Redis | None = None,
 ) -> UserOut | None:
     user = await user_repo.get_user_by_id(session, user_id)
     if user is None:
@@ -103,9 +549,15 @@ async def update_user(
         setattr(user, key, value)
 
     user = await user_repo.update_user(session, user)
+    if redis is not None:
+        await user_cache_repo.invalidate_user(redis, user_id)
     return _to_schema(user)
 
-async def delete_user(session: AsyncSession, user_id: int) -> bool:
+async def delete_user(
+    session: AsyncSession,
+    user_id: int,
+    redis: Redis | None = None,
+) -> bool:
     # 1. 先查出对象
     user = await user_repo.get_user_by_id(session, user_id)
     if not user:
@@ -121,6 +573,9 @@ async def delete_user(session: AsyncSession, user_id: int) -> bool:
         
         # 如果没有用 begin() 装饰器，则需要手动 commit
         await session.commit() 
+        if redis is not None:
+            await user_cache_repo.invalidate_counts(redis)
+            await user_cache_repo.invalidate_user(redis, user_id)
         return True
     except Exception:
         await session.rollback() # 发生异常务必回滚
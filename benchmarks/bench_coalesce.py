@@ -0,0 +1,113 @@
+"""测量逐字上游经过不同 SSE 封帧方式时，每条流的 CPU 开销和输出帧数。
+
+- raw：每个 chunk 单独 sse_data 封帧（合并前 /agents、/stream 的做法）
+- legacy：改造前的 coalesce_sse，每次唤醒都 ensure_future(wake.wait()) + asyncio.wait(timeout)
+- coalesce：当前的 coalesce_sse，每批只登记一个 call_at 截止时间
+
+STREAMS 条流并发，每条流 CHARS 个单字符 chunk，chunk 之间间隔 GAP 秒；
+下游只统计帧数和字节数，不做网络写入。
+
+运行：python -m benchmarks.bench_coalesce
+"""
+
+import asyncio
+from contextlib import suppress
+import time
+from typing import AsyncIterator, Callable
+
+from app.core.streaming import coalesce_sse, sse_data
+
+
+STREAMS = 200
+CHARS = 1000
+GAP = 0.001
+
+
+async def upstream() -> AsyncIterator[str]:
+    for _ in range(CHARS):
+        await asyncio.sleep(GAP)
+        yield "字"
+
+
+async def raw(source: AsyncIterator[str]) -> AsyncIterator[str]:
+    async for chunk in source:
+        yield sse_data(chunk)
+
+
+async def legacy_coalesce(
+    source: AsyncIterator[str], max_bytes: int = 2048, max_delay: float = 0.1
+) -> AsyncIterator[str]:
+    """改造前的 coalesce_sse，仅用于对比。"""
+    buffer: list[str] = []
+    size = 0
+    finished = False
+    wake = asyncio.Event()
+
+    async def pump() -> None:
+        nonlocal size, finished
+        try:
+            async for chunk in source:
+                buffer.append(chunk)
+                size += len(chunk.encode())
+                wake.set()
+        finally:
+            finished = True
+            wake.set()
+
+    loop = asyncio.get_running_loop()
+    task = asyncio.create_task(pump())
+    first = True
+    try:
+        while True:
+            await wake.wait()
+            wake.clear()
+            if not first:
+                deadline = loop.time() + max_delay
+                while not finished and size < max_bytes:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    waiter = asyncio.ensure_future(wake.wait())
+                    try:
+                        await asyncio.wait({waiter}, timeout=remaining)
+                    finally:
+                        waiter.cancel()
+                    wake.clear()
+            first = False
+            if buffer:
+                text = "".join(buffer)
+                buffer.clear()
+                size = 0
+                yield sse_data(text)
+            if finished:
+                return
+    finally:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+
+
+async def run(stage: Callable[[AsyncIterator[str]], AsyncIterator[str]]) -> tuple[float, float, float]:
+    counts = [0, 0]
+
+    async def consume() -> None:
+        async for frame in stage(upstream()):
+            counts[0] += 1
+            counts[1] += len(frame.encode())
+
+    cpu = time.process_time()
+    await asyncio.gather(*(consume() for _ in range(STREAMS)))
+    cpu = time.process_time() - cpu
+    return cpu / STREAMS * 1000, counts[0] / STREAMS, counts[1] / STREAMS
+
+
+async def main() -> None:
+    print(f"streams={STREAMS}, chars/stream={CHARS}, gap={GAP * 1000:.0f}ms")
+    print(f"{'':>9} {'CPU ms/stream':>14} {'frames/stream':>14} {'bytes/stream':>13}")
+    for name, stage in (("raw", raw), ("legacy", legacy_coalesce), ("coalesce", coalesce_sse)):
+        cpu_ms, frames, nbytes = await run(stage)
+        print(f"{name:>9} {cpu_ms:>14.1f} {frames:>14.0f} {nbytes:>13.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
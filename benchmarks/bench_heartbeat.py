@@ -0,0 +1,72 @@
+"""对比空闲 SSE 订阅者的两种心跳方式：每个订阅者 wait_for 超时 vs 共享 Heartbeat tick。
+
+N 个订阅者全程没有真实事件，统计固定墙钟时间内的进程 CPU 时间（事件循环开销）
+以及每个连接收到的心跳字节数。两种方式发送的都是同样的 event: ping 帧，
+差异只来自调度方式。为缩短运行时间，心跳间隔压缩到 INTERVAL 秒。
+
+运行：python -m benchmarks.bench_heartbeat
+"""
+
+import asyncio
+import time
+
+from app.core.heartbeat import Heartbeat
+from app.core.progress import ProgressBus, sse_pack
+
+
+SUBSCRIBERS = 10000
+INTERVAL = 0.5
+DURATION = 5.0
+
+
+async def legacy_subscriber(trace_id: str, counter: list[int]) -> None:
+    """改造前的 ProgressBus.subscribe 等待方式，仅用于对比。"""
+    queue: asyncio.Queue = asyncio.Queue(maxsize=200)
+    while True:
+        try:
+            await asyncio.wait_for(queue.get(), timeout=INTERVAL)
+        except asyncio.TimeoutError:
+            ping = sse_pack("ping", {"event": "ping", "trace_id": trace_id, "ts": time.time()})
+            counter[0] += len(ping.encode())
+
+
+async def shared_subscriber(bus: ProgressBus, trace_id: str, counter: list[int]) -> None:
+    async for frame in bus.subscribe(trace_id):
+        counter[0] += len(frame.data)
+
+
+async def run(make_task) -> tuple[float, float]:
+    counter = [0]
+    tasks = [asyncio.create_task(make_task(f"tr-{i:08d}", counter)) for i in range(SUBSCRIBERS)]
+    await asyncio.sleep(0)
+
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    await asyncio.sleep(DURATION)
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return cpu / wall * 100, counter[0] / SUBSCRIBERS
+
+
+async def main() -> None:
+    legacy_cpu, legacy_bytes = await run(legacy_subscriber)
+
+    heartbeat = Heartbeat(INTERVAL)
+    bus = ProgressBus(heartbeat=heartbeat)
+    shared_cpu, shared_bytes = await run(
+        lambda trace_id, counter: shared_subscriber(bus, trace_id, counter)
+    )
+    await heartbeat.close()
+
+    print(f"subscribers={SUBSCRIBERS}, interval={INTERVAL}s, duration={DURATION}s")
+    print(f"{'':>8} {'loop CPU':>9} {'ping bytes/conn':>16}")
+    print(f"{'legacy':>8} {legacy_cpu:>8.1f}% {legacy_bytes:>16.0f}")
+    print(f"{'shared':>8} {shared_cpu:>8.1f}% {shared_bytes:>16.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+"""测量 ProgressBus.publish 的吞吐随同一 trace 订阅者数量（1 ~ 10k）的变化。
+
+对照组是改造前的做法：全局锁 + 每个订阅者各自 sse_pack/json.dumps 一次。
+只测发布与入队，订阅者不消费；队列满后按丢最旧的逻辑继续。
+
+运行：python -m benchmarks.bench_progress_publish
+"""
+
+import asyncio
+import time
+
+from app.core.progress import ProgressBus, ProgressEvent, sse_pack
+
+
+SUBSCRIBERS = (1, 10, 100, 1000, 10000)
+EVENTS = 200
+
+
+def payload(i: int) -> dict:
+    return {
+        "stage": "tool_start",
+        "progress": i % 100,
+        "message": "PDF_Parser started",
+        "ts": time.time(),
+        "meta": {"tool": "PDF_Parser"},
+    }
+
+
+class LegacyBus:
+    """改造前的发布路径，仅用于对比。"""
+
+    def __init__(self) -> None:
+        self._subs: set[asyncio.Queue] = set()
+        self._seq = 0
+        self._lock = asyncio.Lock()
+
+    async def publish(self, trace_id: str, data: dict) -> None:
+        async with self._lock:
+            self._seq += 1
+            subscribers = list(self._subs)
+        event = ProgressEvent(trace_id=trace_id, seq=self._seq, **data).model_dump()
+        for queue in subscribers:
+            # 每个订阅者各自编码一次
+            frame = sse_pack("progress", event, event_id=event["seq"]).encode()
+            try:
+                queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                queue.get_nowait()
+                queue.put_nowait(frame)
+
+
+async def bench_new(subscribers: int) -> float:
+    bus = ProgressBus()
+    # 直接登记订阅队列，与对照组一样只测发布和入队
+    for _ in range(subscribers):
+        await bus._attach("bench", asyncio.Queue(maxsize=200), 0)
+
+    start = time.perf_counter()
+    for i in range(EVENTS):
+        await bus.publish("bench", payload(i))
+    return EVENTS / (time.perf_counter() - start)
+
+
+async def bench_legacy(subscribers: int) -> float:
+    bus = LegacyBus()
+    bus._subs = {asyncio.Queue(maxsize=200) for _ in range(subscribers)}
+    start = time.perf_counter()
+    for i in range(EVENTS):
+        await bus.publish("bench", payload(i))
+    return EVENTS / (time.perf_counter() - start)
+
+
+async def main() -> None:
+    print(f"{'subscribers':>11} {'legacy ev/s':>12} {'shared ev/s':>12} {'speedup':>8}")
+    for subscribers in SUBSCRIBERS:
+        legacy = await bench_legacy(subscribers)
+        shared = await bench_new(subscribers)
+        print(f"{subscribers:>11} {legacy:>12.0f} {shared:>12.0f} {shared / legacy:>7.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,89 @@
+"""对比 /users/raw 旧序列化路径与 ModelResponse 快速路径的单请求 CPU 耗时。
+
+运行：python -m benchmarks.bench_user_serialization
+"""
+
+from datetime import datetime
+import json
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from app.core.responses import ModelResponse
+from app.schemas import UserOut, UserPage
+from app.services.user_service import _deserialize_ext_json, _row_to_schema
+
+
+SIZE = 100
+ROUNDS = 300
+
+
+def make_rows() -> list[dict]:
+    ext = {f"attr_{i}": {"value": "x" * 40, "tags": list(range(10))} for i in range(30)}
+    ext_text = json.dumps(ext, ensure_ascii=False)
+    return [
+        {
+            "id": 1000 - i,
+            "username": f"user_{i}",
+            "password": "secret",
+            "age": 20 + i % 50,
+            "ext_json": ext_text,
+            "create_time": datetime(2026, 1, 1, 12, 0, 0, 123000),
+        }
+        for i in range(SIZE)
+    ]
+
+
+page_adapter = TypeAdapter(UserPage)
+
+
+def old_path(rows: list[dict]) -> bytes:
+    items = [
+        UserOut(
+            id=row["id"],
+            username=row["username"],
+            password=row["password"],
+            age=row["age"],
+            ext_json=_deserialize_ext_json(row["ext_json"]),
+            create_time=row["create_time"],
+        )
+        for row in rows
+    ]
+    page = UserPage(total=10**6, page=1, size=SIZE, items=items)
+    # FastAPI 对 response_model 的处理：dump -> 再校验 -> jsonable_encoder -> json.dumps
+    validated = page_adapter.validate_python(page.model_dump())
+    return JSONResponse(jsonable_encoder(validated)).body
+
+
+def new_path(rows: list[dict]) -> bytes:
+    items = [_row_to_schema(row) for row in rows]
+    page = UserPage.model_construct(
+        total=10**6, total_mode="exact", page=1, size=SIZE, items=items, next_cursor=None
+    )
+    return ModelResponse(page).body
+
+
+def bench(fn, rows: list[dict]) -> float:
+    fn(rows)
+    start = time.process_time()
+    for _ in range(ROUNDS):
+        fn(rows)
+    return (time.process_time() - start) / ROUNDS * 1000
+
+
+def main() -> None:
+    rows = make_rows()
+    assert json.loads(old_path(rows))["items"] == json.loads(new_path(rows))["items"]
+
+    old_ms = bench(old_path, rows)
+    new_ms = bench(new_path, rows)
+    print(f"rows/page={SIZE}, payload={len(new_path(rows)) / 1024:.0f} KiB")
+    print(f"old path: {old_ms:.2f} ms CPU/request")
+    print(f"new path: {new_ms:.2f} ms CPU/request")
+    print(f"saved:    {old_ms - new_ms:.2f} ms ({(1 - new_ms / old_ms) * 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
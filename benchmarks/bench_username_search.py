@@ -0,0 +1,84 @@
+"""对比 username 三种匹配方式（prefix / contains / fulltext）在 MySQL 上的耗时。
+
+需要可连接的 MySQL（读取 .env 配置），并已执行 ensure_user_schema 建好索引。
+运行：python -m benchmarks.bench_username_search --keyword user_12 [--seed 200000]
+"""
+
+import argparse
+import asyncio
+import random
+import string
+import time
+
+from sqlalchemy import text
+
+from app.db.mysql import create_mysql_engine, create_session_factory, ensure_user_schema
+from app.repositories import user_repo
+from app.schemas import USER_FIELDS
+
+
+MODES = ("contains", "prefix", "fulltext")
+
+
+async def seed(session_factory, rows: int) -> None:
+    batch = 5000
+    async with session_factory() as session:
+        for start in range(0, rows, batch):
+            await user_repo.insert_users(
+                session,
+                [
+                    {
+                        "username": f"user_{i}_" + "".join(random.choices(string.ascii_lowercase, k=6)),
+                        "password": None,
+                        "age": random.randint(1, 90),
+                        "ext_json": None,
+                    }
+                    for i in range(start, min(start + batch, rows))
+                ],
+            )
+
+
+async def explain(session, keyword: str, mode: str) -> str:
+    where_clause, params = user_repo._build_filters(keyword, None, None, None, mode)
+    result = await session.execute(text(f"EXPLAIN SELECT id FROM t_user{where_clause}"), params)
+    row = result.mappings().first()
+    return f"type={row['type']} key={row['key']} rows={row['rows']}"
+
+
+async def timed(session, keyword: str, mode: str, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await user_repo.count_users(session, keyword, None, None, None, mode)
+        await user_repo.list_users_raw(
+            session, 1, 10, keyword, None, None, None, USER_FIELDS, None, mode
+        )
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--keyword", default="user_12")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0, help="先插入 N 条随机用户")
+    args = parser.parse_args()
+
+    engine = create_mysql_engine()
+    session_factory = create_session_factory(engine)
+    try:
+        await ensure_user_schema(engine)
+        if args.seed:
+            await seed(session_factory, args.seed)
+
+        async with session_factory() as session:
+            total = await user_repo.count_users(session, None, None, None)
+            print(f"t_user rows={total}, keyword={args.keyword!r}")
+            for mode in MODES:
+                plan = await explain(session, args.keyword, mode)
+                cost = await timed(session, args.keyword, mode, args.rounds)
+                print(f"{mode:<9} {cost:8.2f} ms/request  {plan}")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())